@@ -2,6 +2,8 @@ from app import create_app, db
 from app.models.user import User, Address
 from app.models.product import Product
 from app.models.order import Order, OrderItem
+from app.utils.order_number import generate_order_number
+from app.utils.order_service import fill_item_snapshots
 from datetime import datetime, timedelta
 import random
 import uuid
@@ -9,13 +11,6 @@ import uuid
 # 示例订单状态
 ORDER_STATUSES = ['pending', 'paid', 'shipped', 'delivered', 'canceled']
 
-def generate_order_number():
-    """生成订单号，格式为：年月日+8位随机数字"""
-    now = datetime.now()
-    date_prefix = now.strftime('%Y%m%d')
-    random_suffix = ''.join([str(random.randint(0, 9)) for _ in range(8)])
-    return f"{date_prefix}{random_suffix}"
-
 def add_sample_orders():
     """添加示例订单数据"""
     app = create_app()
@@ -88,6 +83,9 @@ def add_sample_orders():
         
         # 提交事务
         db.session.commit()
+        # 为新订单项写入商品快照
+        fill_item_snapshots()
+        db.session.commit()
         print("成功添加示例订单数据")
 
 if __name__ == "__main__":
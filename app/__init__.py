@@ -19,6 +19,20 @@ def create_app(test_config=None):
         SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(app.instance_path, 'green.sqlite'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         MAX_CONTENT_LENGTH=16 * 1024 * 1024,  # 最大上传文件大小为16MB
+        PUBLIC_BASE_URL='https://web-production-85aa.up.railway.app',  # 图片等站内资源的完整 URL 前缀
+        MAX_PAGE_SIZE=100,  # 列表接口单页最大条数
+        MAX_BATCH_IDS=50,  # 批量查询商品接口一次最多的商品数
+        MAX_BULK_ORDER_IDS=1000,  # 批量修改订单状态接口一次最多的订单数
+        MAX_CART_BATCH_OPS=100,  # 购物车批量操作接口一次最多的操作数
+        CART_BACKEND='database',  # 购物车存储：database 直接写库 / memory 进程内存 + 定时写回（仅限单 worker）
+        CART_FLUSH_INTERVAL=2,  # memory 后端：写回间隔（秒）
+        CART_MAX_DIRTY=1000,  # memory 后端：待写回的修改超过该条数时立即写回
+        CATALOG_CACHE_TTL=30,  # 商品目录缓存过期时间（秒），0 表示关闭
+        CATALOG_CACHE_SIZE=2048,  # 商品目录缓存最大条目数
+        ORDER_ARCHIVE_DAYS=180,  # 已完结订单超过该天数后移入归档表
+        IDEMPOTENCY_KEY_TTL=24 * 3600,  # 幂等键保留时间（秒）
+        IDEMPOTENCY_WAIT_TIMEOUT=10,  # 重复请求等待首个请求完成的最长时间（秒）
+        IDEMPOTENCY_LEASE=60,  # in_progress 记录的租约（秒），超时未完成（如进程崩溃）时由重试的请求接手执行
         JWT_TOKEN_LOCATION=["headers"],  # 添加JWT配置
         JWT_HEADER_NAME="Authorization",  # JWT头部名称
         JWT_HEADER_TYPE="Bearer",  # JWT头部类型
@@ -52,6 +66,21 @@ def create_app(test_config=None):
     # 初始化扩展
     db.init_app(app)
 
+    # 配置商品目录缓存
+    from app.utils.cache import catalog_cache
+    catalog_cache.configure(maxsize=app.config['CATALOG_CACHE_SIZE'], ttl=app.config['CATALOG_CACHE_TTL'])
+    from app.utils.idempotency import completed_responses
+    completed_responses.configure(ttl=min(600, app.config['IDEMPOTENCY_KEY_TTL']))
+    if app.config['CART_BACKEND'] == 'memory':
+        from app.utils.cart_store import memory_cart_store
+        memory_cart_store.init_app(app)
+
+    # 补齐已有数据库中缺失的表、列、索引（含商品全文索引）
+    if app.config.get('AUTO_UPGRADE_SCHEMA', True):
+        from app.utils.schema import upgrade_schema
+        with app.app_context():
+            upgrade_schema()
+
     # 配置CORS - 允许前端跨域请求
     CORS(app, 
          resources={r"/*": {
@@ -1,4 +1,6 @@
 from app.models.user import User, Address
-from app.models.product import Product, ProductImage
-from app.models.order import Order, OrderItem 
-from app.models.cart import CartItem
\ No newline at end of file
+from app.models.product import Product, ProductImage, Category, Tag
+from app.models.order import Order, OrderItem, OrderArchive, OrderItemArchive
+from app.models.cart import CartItem
+from app.models.idempotency import IdempotencyKey
+from app.models.meta import AppMeta
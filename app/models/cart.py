@@ -3,6 +3,12 @@ from datetime import datetime
 
 class CartItem(db.Model):
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        # 每个用户的每个商品只有一行，加入购物车用 INSERT ... ON CONFLICT 累加数量
+        db.Index('ix_cart_items_user_id_product_id', 'user_id', 'product_id', unique=True),
+        # 已删除购物车项的 id 不再分配给新行，memory 后端延迟写回时不会改到新行，见 cart.ensure_autoincrement_id
+        {'sqlite_autoincrement': True},
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
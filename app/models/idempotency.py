@@ -0,0 +1,20 @@
+from app import db
+from datetime import datetime
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'endpoint', 'key', name='uq_idempotency_keys_scope_endpoint_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), nullable=False)  # 客户端传入的 Idempotency-Key
+    scope = db.Column(db.String(64), nullable=False, default='')  # 请求方（用户 ID），不同用户的键互不影响
+    endpoint = db.Column(db.String(100), nullable=False)
+    request_hash = db.Column(db.String(40), nullable=False)  # 请求体哈希，同一个键不能用于不同请求
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress / completed
+    status_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, nullable=True)  # 当前执行者开始执行的时间，超过 IDEMPOTENCY_LEASE 秒可被接手
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,9 @@
+from app import db
+
+
+class AppMeta(db.Model):
+    """应用级计数器与标记（如分类列表版本号、已完成的一次性迁移）"""
+    __tablename__ = 'app_meta'
+
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
@@ -3,6 +3,12 @@ from datetime import datetime
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_created_at_id', 'created_at', 'id'),
+        db.Index('ix_orders_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        # 已删除（含已归档）订单的 id 不再分配给新订单，见 archive.ensure_autoincrement_ids
+        {'sqlite_autoincrement': True},
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -14,6 +20,8 @@ class Order(db.Model):
     address_id = db.Column(db.Integer, db.ForeignKey('addresses.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 小程序订单详情的 JSON 快照，下单和状态变更时重新生成；只在读取详情时加载
+    detail_snapshot = db.deferred(db.Column(db.Text, nullable=True))
 
     # 关联
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade="all, delete-orphan")
@@ -42,12 +50,17 @@ class Order(db.Model):
 
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
+    __table_args__ = {'sqlite_autoincrement': True}
 
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)  # 下单时的价格，因产品价格可能会变动
+    # 下单时的商品快照，读取订单时不再查询商品表，商品修改或删除后订单内容不变
+    product_name = db.Column(db.String(100), nullable=True)
+    product_image = db.Column(db.String(500), nullable=True)  # 主图 URL
+    product_category = db.Column(db.String(50), nullable=True)
 
     product = db.relationship('Product', back_populates='order_items')
 
@@ -56,8 +69,48 @@ class OrderItem(db.Model):
             'id': self.id,
             'order_id': self.order_id,
             'product_id': self.product_id,
-            'product_name': self.product.name if self.product else None,
+            'product_name': self.product_name,
             'quantity': self.quantity,
             'price': self.price,
             'subtotal': self.price * self.quantity
         }
+
+class OrderArchive(db.Model):
+    """归档订单：超过保留期的已送达、已取消订单，字段与 orders 相同，id 保持不变"""
+    __tablename__ = 'orders_archive'
+    __table_args__ = (
+        db.Index('ix_orders_archive_created_at_id', 'created_at', 'id'),
+        db.Index('ix_orders_archive_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    order_number = db.Column(db.String(30), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False)
+    total_amount = db.Column(db.Float, nullable=False)
+    address_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    detail_snapshot = db.deferred(db.Column(db.Text, nullable=True))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    items = db.relationship(
+        'OrderItemArchive',
+        primaryjoin='OrderArchive.id == foreign(OrderItemArchive.order_id)',
+        order_by='OrderItemArchive.id',
+        lazy=True,
+        viewonly=True
+    )
+
+class OrderItemArchive(db.Model):
+    """归档订单项，字段与 order_items 相同"""
+    __tablename__ = 'order_items_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    product_id = db.Column(db.Integer, nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    product_name = db.Column(db.String(100), nullable=True)
+    product_image = db.Column(db.String(500), nullable=True)
+    product_category = db.Column(db.String(50), nullable=True)
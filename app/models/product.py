@@ -3,34 +3,42 @@ from datetime import datetime
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    sku = db.Column(db.String(64), nullable=True, unique=True, index=True)  # 供应商商品编码，批量导入时按此更新
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    price = db.Column(db.Float, nullable=False)
-    stock = db.Column(db.Integer, default=0)
-    category = db.Column(db.String(50), nullable=True)
+    price = db.Column(db.Float, nullable=False, index=True)
+    stock = db.Column(db.Integer, default=0, index=True)
+    category = db.Column(db.String(50), nullable=True)  # 分类名称，与 category_id 同步维护
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # 环保属性
     eco_friendly = db.Column(db.Boolean, default=False)
-    eco_labels = db.Column(db.String(200), nullable=True)
-    material = db.Column(db.String(100), nullable=True)
+    eco_labels = db.Column(db.String(200), nullable=True)  # 逗号分隔的标签名称，与 product_tags 同步维护
+    material = db.Column(db.String(100), nullable=True, index=True)
     carbon_footprint = db.Column(db.Float, nullable=True)
 
     # 关联
+    category_ref = db.relationship('Category', back_populates='products')
     images = db.relationship('ProductImage', back_populates='product', lazy=True, cascade="all, delete-orphan")
     order_items = db.relationship('OrderItem', back_populates='product', lazy=True)
 
     def to_dict(self):
         return {
             'id': self.id,
+            'sku': self.sku,
             'name': self.name,
             'description': self.description,
             'price': self.price,
             'stock': self.stock,
             'category': self.category,
+            'category_id': self.category_id,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'eco_friendly': self.eco_friendly,
             'eco_labels': self.eco_labels.split(',') if self.eco_labels else [],
@@ -39,6 +47,46 @@ class Product(db.Model):
             'images': [img.url for img in self.images]
         }
 
+class Category(db.Model):
+    __tablename__ = 'categories'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    image = db.Column(db.String(500), nullable=True)
+    product_count = db.Column(db.Integer, nullable=False, default=0)  # 冗余的商品数，随商品增删改维护
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    products = db.relationship('Product', back_populates='category_ref', lazy=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'image': self.image,
+            'product_count': self.product_count
+        }
+
+# 商品与环保标签的多对多关联，按标签筛选时从 tag_id 定位商品
+product_tags = db.Table(
+    'product_tags',
+    db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True),
+    db.Index('ix_product_tags_tag_id_product_id', 'tag_id', 'product_id')
+)
+
+class Tag(db.Model):
+    __tablename__ = 'tags'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name
+        }
+
 class ProductImage(db.Model):
     __tablename__ = 'product_images'
     
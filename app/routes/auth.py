@@ -1,6 +1,8 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from app.models.user import User
 from app import db
+from app.utils.pagination import clamp_page_size, keyset_paginate, InvalidCursor
+from app.utils import export
 from datetime import datetime, timedelta, timezone
 
 bp = Blueprint('auth', __name__, url_prefix='/api')
@@ -263,7 +265,8 @@ def get_users():
     """获取用户列表 - 管理员功能"""
     # 获取分页参数
     page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    per_page = clamp_page_size(request.args.get('per_page', 10, type=int))
+    cursor = request.args.get('cursor')  # 传入 cursor（首页为空字符串）时使用游标分页
     
     # 获取筛选参数
     username = request.args.get('username')
@@ -279,8 +282,14 @@ def get_users():
         query = query.filter(User.email.like(f'%{email}%'))
     
     # 执行分页查询
-    pagination = query.order_by(User.created_at.desc()).paginate(page=page, per_page=per_page)
-    users = pagination.items
+    if cursor is not None:
+        try:
+            users, next_cursor = keyset_paginate(query, User, cursor, per_page)
+        except InvalidCursor as e:
+            return jsonify({"code": 400, "msg": str(e)}), 400
+    else:
+        pagination = query.order_by(User.created_at.desc()).paginate(page=page, per_page=per_page)
+        users = pagination.items
     
     # 转换为字典列表
     user_list = []
@@ -294,11 +303,39 @@ def get_users():
         }
         user_list.append(user_dict)
     
+    if cursor is not None:
+        return jsonify({
+            "items": user_list,
+            "next_cursor": next_cursor
+        })
+    
     return jsonify({
         "items": user_list,
         "total": pagination.total
     })
 
+@bp.route('/users/export', methods=['GET'])
+def export_users():
+    """导出用户 - 管理员功能
+
+    format: csv（默认）/ jsonl；start_date、end_date: 注册日期范围 YYYY-MM-DD
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify({"code": 400, "msg": "不支持的导出格式"}), 400
+    try:
+        start, end = export.parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+    except ValueError:
+        return jsonify({"code": 400, "msg": "日期格式应为 YYYY-MM-DD"}), 400
+    
+    generator = export.export_users(fmt, start=start, end=end)
+    filename = f"users-{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(generator),
+        mimetype=export.MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @bp.route('/users/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
     """管理员删除用户 - 管理员功能"""
@@ -328,7 +365,7 @@ def delete_user(user_id):
         
         try:
             # 级联删除用户的所有关联数据
-            from app.models.order import Order, OrderItem
+            from app.models.order import Order, OrderItem, OrderArchive, OrderItemArchive
             
             # 1. 删除用户的订单项和订单
             orders = Order.query.filter_by(user_id=user_id).all()
@@ -344,7 +381,15 @@ def delete_user(user_id):
                     
                     # 删除订单
                     db.session.delete(order)
-            
+
+            # 删除用户已归档的订单项和订单（与上面在同一事务中）
+            archived_ids = db.session.query(OrderArchive.id).filter_by(user_id=user_id)
+            archived_items = OrderItemArchive.query.filter(OrderItemArchive.order_id.in_(archived_ids)) \
+                .delete(synchronize_session=False)
+            archived_orders = OrderArchive.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+            if archived_orders:
+                print(f"删除用户 {user.username} 的 {archived_orders} 个归档订单、{archived_items} 个归档订单项")
+
             # 2. 删除用户的地址
             if hasattr(user, 'addresses') and user.addresses:
                 print(f"删除用户 {user.username} 的 {len(user.addresses)} 个地址记录")
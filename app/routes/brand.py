@@ -1,12 +1,14 @@
 from flask import Blueprint, request, jsonify
 from app import db
 from flask_jwt_extended import jwt_required
+from app.utils.http_cache import conditional_get
+import hashlib
+import json
 
 bp = Blueprint('brand', __name__, url_prefix='/api/brand')
 
-@bp.route('/info', methods=['GET'])
-def get_brand_info():
-    """获取品牌介绍信息"""
+def _load_brand_info():
+    """品牌介绍数据"""
     # 模拟品牌数据，实际应该从数据库获取
     brand_info = {
         'title': '绿野鲜踪电商交易平台',
@@ -76,10 +78,19 @@ def get_brand_info():
             }
         ]
     }
+    return brand_info
+
+# 品牌数据是静态内容，以内容哈希作为版本，修改内容后 ETag 随之变化
+BRAND_INFO_VERSION = hashlib.sha1(
+    json.dumps(_load_brand_info(), sort_keys=True, ensure_ascii=False).encode('utf-8')
+).hexdigest()
 
-    
+@bp.route('/info', methods=['GET'])
+@conditional_get(version=lambda: BRAND_INFO_VERSION, max_age=300)
+def get_brand_info():
+    """获取品牌介绍信息"""
     return jsonify({
         'code': 200,
         'msg': '成功',
-        'data': brand_info
-    }) 
\ No newline at end of file
+        'data': _load_brand_info()
+    })
@@ -1,9 +1,8 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app import db
-from app.models.cart import CartItem
-from app.models.product import Product
 from app.models.user import User
-from datetime import datetime
+from app.utils import cart
+from app.utils.cart_store import get_cart_store
 
 bp = Blueprint('cart', __name__, url_prefix='/api/cart')
 
@@ -19,24 +18,8 @@ def get_cart_items():
     if not user:
         return jsonify({'code': 404, 'msg': '用户不存在'}), 404
 
-    cart_items = CartItem.query.filter_by(user_id=user_id).all()
-
-    enriched_items = []
-    for item in cart_items:
-        product = Product.query.get(item.product_id)
-        image = product.images[0].url if product.images else ''
-        # 防止重复拼接 localhost
-        if image and not image.startswith('http'):
-            image = f"https://web-production-85aa.up.railway.app{image}"
-
-        enriched_items.append({
-            'id': item.id,
-            'product_id': item.product_id,
-            'quantity': item.quantity,
-            'name': product.name,
-            'price': product.price,
-            'image': image
-        })
+    # 购物车项、商品和主图一次查询获取；商品已删除或库存不足时通过 status 标记
+    enriched_items = get_cart_store().list_items(user_id)
 
     return jsonify({'code': 200, 'msg': '成功', 'data': enriched_items})
 
@@ -55,18 +38,10 @@ def add_to_cart():
     if not product_id:
         return jsonify({'code': 400, 'msg': '缺少商品ID'}), 400
 
-    product = Product.query.get(product_id)
-    if not product:
+    # 一条 INSERT ... ON CONFLICT 完成新增或累加，商品不存在时不写入
+    if not get_cart_store().add_item(user_id, product_id, quantity):
         return jsonify({'code': 404, 'msg': '商品不存在'}), 404
 
-    item = CartItem.query.filter_by(user_id=user_id, product_id=product_id).first()
-    if item:
-        item.quantity += quantity
-    else:
-        item = CartItem(user_id=user_id, product_id=product_id, quantity=quantity)
-        db.session.add(item)
-
-    db.session.commit()
     return jsonify({'code': 200, 'msg': '添加成功'})
 
 # 更新购物车商品数量
@@ -84,12 +59,9 @@ def update_cart():
     if not product_id or quantity is None:
         return jsonify({'code': 400, 'msg': '参数不完整'}), 400
 
-    item = CartItem.query.filter_by(user_id=user_id, product_id=product_id).first()
-    if not item:
+    if not get_cart_store().set_quantity(user_id, product_id, quantity):
         return jsonify({'code': 404, 'msg': '购物车项不存在'}), 404
 
-    item.quantity = quantity
-    db.session.commit()
     return jsonify({'code': 200, 'msg': '更新成功'})
 
 # 删除购物车项
@@ -101,11 +73,31 @@ def delete_cart(product_id):
 
     user_id = int(token.split(' ')[1].split(':')[0])
 
-    item = CartItem.query.filter_by(user_id=user_id, product_id=product_id).first()
-    if not item:
+    if not get_cart_store().remove_item(user_id, product_id):
         return jsonify({'code': 404, 'msg': '购物车项不存在'}), 404
 
-    db.session.delete(item)
-    db.session.commit()
     return jsonify({'code': 200, 'msg': '删除成功'})
 
+# 批量修改购物车：add / set / remove 操作在同一个事务中执行，返回修改后的购物车
+@bp.route('/batch', methods=['POST'])
+def batch_update_cart():
+    token = request.headers.get('Authorization')
+    if not token or not token.startswith('Bearer '):
+        return jsonify({'code': 401, 'msg': '未授权'}), 401
+
+    user_id = int(token.split(' ')[1].split(':')[0])
+    data = request.get_json() or {}
+    try:
+        ops = cart.parse_ops(data.get('ops'), current_app.config['MAX_CART_BATCH_OPS'])
+    except ValueError as e:
+        return jsonify({'code': 400, 'msg': str(e)}), 400
+
+    store = get_cart_store()
+    try:
+        errors = store.apply_ops(user_id, ops)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'code': 500, 'msg': f'购物车更新失败: {str(e)}'}), 500
+
+    # 与 /list 相同的结构，errors 列出未能执行的操作
+    return jsonify({'code': 200, 'msg': '成功', 'data': store.list_items(user_id), 'errors': errors})
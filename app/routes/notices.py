@@ -1,4 +1,5 @@
 from flask import Blueprint, request, jsonify
+from app.utils.http_cache import conditional_get
 import datetime
 
 bp = Blueprint('notices', __name__, url_prefix='/api/notices')
@@ -42,7 +43,9 @@ mock_notices = [
     }
 ]
 
+# 公告只会追加，以公告数量作为内容版本
 @bp.route('/list', methods=['GET'])
+@conditional_get(version=lambda: len(mock_notices), max_age=60)
 def get_notices_list():
     """获取公告列表"""
     page = int(request.args.get('page', 1))
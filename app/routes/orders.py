@@ -1,57 +1,123 @@
-from flask import Blueprint, request, jsonify
-from app.models.order import Order, OrderItem
-from app.models.product import Product
-from app.models.user import User, Address
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
+from app.models.order import Order, OrderItem, OrderArchive
+from app.models.user import User
 from app import db
+from app.utils.pagination import clamp_page_size, InvalidCursor
+from app.utils.archive import keyset_paginate_with_archive, paginate_with_archive
+from app.utils.cache import invalidate_products
+from app.utils.order_service import (
+    place_order, OrderError, ORDER_STATUSES, check_transition, restock_orders, bulk_update_status,
+    refresh_detail_snapshots, order_detail, checkout_cart
+)
+from app.utils.idempotency import idempotent
+from app.utils.cart_store import get_cart_store
+from app.utils.serializers import (
+    order_query, archived_order_query, serialize_orders, serialize_mini_orders
+)
+from app.utils import export
+from app.utils.order_number import generate_order_number
 import datetime
-import random
-import string
 
 bp = Blueprint('orders', __name__, url_prefix='/api/orders')
 
-def generate_order_number():
-    """生成订单号: 当前日期 + 6位随机字符"""
-    date_str = datetime.datetime.now().strftime('%Y%m%d')
-    random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f"{date_str}{random_str}"
+def _prefix_match(column, prefix):
+    """前缀匹配改写为范围查询（column >= prefix AND column < 下一个前缀），可以走索引"""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return column >= prefix, column < upper
 
 @bp.route('', methods=['GET'])
 def get_orders():
+    """管理端订单列表
+
+    筛选：order_number / username / phone 按前缀匹配，status，start_date、end_date（YYYY-MM-DD）；
+    普通分页只在 with_total=1 时返回总数，否则返回 has_more
+    """
     # 获取分页参数
     page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    per_page = clamp_page_size(request.args.get('per_page', 10, type=int))
+    cursor = request.args.get('cursor')  # 传入 cursor（首页为空字符串）时使用游标分页
+    with_total = request.args.get('with_total') in ('1', 'true')
     
     # 获取筛选参数
-    order_number = request.args.get('order_number')
+    order_number = request.args.get('order_number', '').strip()
+    username = request.args.get('username', '').strip()
+    phone = request.args.get('phone', '').strip()
     status = request.args.get('status')
+    try:
+        start, end = export.parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+    except ValueError:
+        return jsonify({'message': '日期格式应为 YYYY-MM-DD'}), 400
+    
+    # 构建查询条件（只查询序列化所需的列），较早的订单在归档表中
+    def filtered(query, model):
+        if order_number:
+            query = query.filter(*_prefix_match(model.order_number, order_number))
+        if username:
+            query = query.filter(*_prefix_match(User.username, username))
+        if phone:
+            query = query.filter(*_prefix_match(User.phone, phone))
+        if status:
+            query = query.filter(model.status == status)
+        if start:
+            query = query.filter(model.created_at >= start)
+        if end:
+            query = query.filter(model.created_at < end)
+        return query
+    
+    query = filtered(order_query(), Order)
+    archive_query = filtered(archived_order_query(), OrderArchive)
+    
+    # 游标分页：直接定位到下一页，不统计总数
+    if cursor is not None:
+        try:
+            orders, next_cursor = keyset_paginate_with_archive(query, archive_query, cursor, per_page)
+        except InvalidCursor as e:
+            return jsonify({'message': str(e)}), 400
+        return jsonify({
+            "items": serialize_orders(orders),
+            "next_cursor": next_cursor
+        })
     
-    # 构建查询条件
-    query = Order.query.join(Order.user)
-    
-    if order_number:
-        query = query.filter(Order.order_number.like(f'%{order_number}%'))
-    if status:
-        query = query.filter(Order.status == status)
-    
-    # 执行分页查询，确保加载用户信息
-    pagination = query.order_by(Order.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
-    orders = pagination.items
-    
-    # 格式化订单数据
-    order_list = [order.to_dict() for order in orders]
-    
-    return jsonify({
-        "items": order_list,
-        "total": pagination.total
-    })
+    # 执行分页查询，用户信息随订单一起查询，订单项和地址在序列化时批量加载
+    orders, total, has_more = paginate_with_archive(query, archive_query, page, per_page, with_total)
+    result = {
+        "items": serialize_orders(orders),
+        "has_more": has_more
+    }
+    if with_total:
+        result["total"] = total
+    return jsonify(result)
+
+@bp.route('/export', methods=['GET'])
+def export_orders():
+    """导出订单及订单项 - 管理员功能
+
+    format: csv（默认）/ jsonl；start_date、end_date: YYYY-MM-DD；status: 订单状态
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify({'message': '不支持的导出格式'}), 400
+    try:
+        start, end = export.parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+    except ValueError:
+        return jsonify({'message': '日期格式应为 YYYY-MM-DD'}), 400
+    
+    generator = export.export_orders(fmt, status=request.args.get('status'), start=start, end=end)
+    filename = f"orders-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(generator),
+        mimetype=export.MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 @bp.route('/<int:id>', methods=['GET'])
 def get_order(id):
-    # 查询订单，同时加载用户信息
-    order = Order.query.join(Order.user).filter(Order.id == id).first_or_404()
+    # 查询订单，同时加载用户信息；不在 orders 中时查询归档表
+    order = order_query().filter(Order.id == id).first() \
+        or archived_order_query().filter(OrderArchive.id == id).first_or_404()
     
     # 返回订单详情
-    return jsonify(order.to_dict())
+    return jsonify(serialize_orders([order])[0])
 
 @bp.route('', methods=['POST'])
 def create_order():
@@ -61,75 +127,23 @@ def create_order():
     if not all(k in data for k in ('user_id', 'address_id', 'items')):
         return jsonify({"message": '缺少必要字段'}), 400
     
-    # 获取数据
-    user_id = data['user_id']
-    address_id = data['address_id']
-    items_data = data['items']
-    
-    # 创建订单
-    new_order = Order(
-        user_id=user_id,
-        address_id=address_id,
-        order_number=generate_order_number(),
-        status='pending',
-        total_amount=0
-    )
-    
-    # 添加订单项
-    total_amount = 0
-    order_items = []
-    
-    for item_data in items_data:
-        product_id = item_data.get('product_id')
-        quantity = item_data.get('quantity', 1)
-        
-        # 查询产品
-        product = Product.query.get(product_id)
-        if not product:
-            continue
-        
-        # 检查库存
-        if product.stock < quantity:
-            return jsonify({"message": f"产品 {product.name} 库存不足"}), 400
-        
-        # 减少库存
-        product.stock -= quantity
-        
-        # 创建订单项
-        order_item = OrderItem(
-            product_id=product_id,
-            quantity=quantity,
-            price=product.price
-        )
-        
-        # 计算小计
-        item_total = product.price * quantity
-        total_amount += item_total
-        
-        order_items.append(order_item)
-    
-    # 更新订单总额
-    new_order.total_amount = round(total_amount, 2)
-    
-    # 保存订单
-    db.session.add(new_order)
-    db.session.flush()  # 获取订单ID
-    
-    # 关联订单项
-    for item in order_items:
-        item.order_id = new_order.id
-        db.session.add(item)
-    
+    # 创建订单（不存在的商品忽略）
     try:
-        db.session.commit()
-        return jsonify({
-            "message": "订单创建成功",
-            "order_id": new_order.id,
-            "order_number": new_order.order_number
-        }), 201
+        new_order = place_order(
+            data['user_id'], data['address_id'], data['items'],
+            order_number=generate_order_number(),
+            skip_missing=True
+        )
+    except OrderError as e:
+        return jsonify({"message": str(e)}), 400
     except Exception as e:
-        db.session.rollback()
         return jsonify({"message": f"创建订单失败: {str(e)}"}), 500
+    
+    return jsonify({
+        "message": "订单创建成功",
+        "order_id": new_order.id,
+        "order_number": new_order.order_number
+    }), 201
 
 @bp.route('/<int:id>/status', methods=['PUT', 'POST'])
 def update_order_status(id):
@@ -141,27 +155,23 @@ def update_order_status(id):
     if 'status' not in data:
         return jsonify({'message': '缺少状态字段'}), 400
     
-    # 验证状态值是否合法
-    valid_statuses = ['pending', 'paid', 'shipped', 'delivered', 'canceled']
-    if data['status'] not in valid_statuses:
-        return jsonify({'message': '无效的状态值'}), 400
-    
     # 验证状态变更的合法性（例如已发货的订单不能取消）
-    if order.status == 'shipped' and data['status'] == 'canceled':
-        return jsonify({'message': '已发货的订单不能取消'}), 400
+    error = check_transition(order.status, data['status'])
+    if error:
+        return jsonify({'message': error}), 400
     
     # 如果取消订单，恢复库存
+    restocked_ids = []
     if data['status'] == 'canceled' and order.status != 'canceled':
-        for item in order.items:
-            product = Product.query.get(item.product_id)
-            if product:
-                product.stock += item.quantity
+        restocked_ids = restock_orders([order.id])
     
     # 更新状态
     order.status = data['status']
     
     try:
+        refresh_detail_snapshots([order.id])
         db.session.commit()
+        invalidate_products(restocked_ids)
         return jsonify({
             'code': 200,
             'message': '订单状态更新成功',
@@ -171,6 +181,37 @@ def update_order_status(id):
         db.session.rollback()
         return jsonify({'message': f'订单状态更新失败: {str(e)}'}), 500
 
+@bp.route('/status/bulk', methods=['POST'])
+def bulk_update_order_status():
+    """批量修改订单状态 - 管理员功能，返回每个订单的处理结果"""
+    data = request.get_json() or {}
+    order_ids = data.get('order_ids')
+    status = data.get('status')
+    
+    if not isinstance(order_ids, list) or not order_ids or not status:
+        return jsonify({'message': '缺少订单ID列表或状态字段'}), 400
+    if status not in ORDER_STATUSES:
+        return jsonify({'message': '无效的状态值'}), 400
+    if not all(isinstance(order_id, int) for order_id in order_ids):
+        return jsonify({'message': '订单ID格式错误'}), 400
+    max_ids = current_app.config['MAX_BULK_ORDER_IDS']
+    if len(order_ids) > max_ids:
+        return jsonify({'message': f'一次最多修改 {max_ids} 个订单'}), 400
+    
+    try:
+        results = bulk_update_status(order_ids, status)
+    except Exception as e:
+        return jsonify({'message': f'批量更新失败: {str(e)}'}), 500
+    
+    succeeded = sum(1 for result in results if result['success'])
+    return jsonify({
+        'code': 200,
+        'message': f'成功 {succeeded} 个，失败 {len(results) - succeeded} 个',
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    }), 200
+
 @bp.route('/list', methods=['GET'])
 def get_orders_list():
     """获取当前用户的订单列表 - 小程序专用接口"""
@@ -199,72 +240,51 @@ def get_orders_list():
     
     # 获取请求参数
     page = request.args.get('page', 1, type=int)
-    size = request.args.get('size', 10, type=int)
+    size = clamp_page_size(request.args.get('size', 10, type=int))
+    cursor = request.args.get('cursor')  # 传入 cursor（首页为空字符串）时使用游标分页
     status = request.args.get('status')  # 订单状态筛选
     
-    # 构建查询
-    query = Order.query.filter_by(user_id=user_id)
+    # 构建查询，较早的订单在归档表中
+    query = order_query().filter(Order.user_id == user_id)
+    archive_query = archived_order_query().filter(OrderArchive.user_id == user_id)
     
     if status and status != 'all':
         query = query.filter(Order.status == status)
+        archive_query = archive_query.filter(OrderArchive.status == status)
     
     # 执行分页查询
-    pagination = query.order_by(Order.created_at.desc()).paginate(page=page, per_page=size)
-    
-    # 处理订单数据
-    orders_list = []
-    for order in pagination.items:
-        items = []
-        for item in order.items:
-            try:
-                product = Product.query.get(item.product_id)
-                product_name = product.name if product else "未知商品"
-                product_image = ""
-                if product and product.images and product.images[0]:
-                    image_url = product.images[0].url
-                    product_image = f"https://web-production-85aa.up.railway.app{image_url}" if image_url.startswith('/') else image_url
-            except Exception as e:
-                print(f"获取商品信息失败: {str(e)}")
-                product_name = "商品信息获取失败"
-                product_image = ""
-            
-            item_data = {
-                "id": item.id,
-                "product_id": item.product_id,
-                "name": product_name,
-                "image": product_image,
-                "price": float(item.price) if item.price else 0,
-                "quantity": item.quantity
+    if cursor is not None:
+        try:
+            orders, next_cursor = keyset_paginate_with_archive(query, archive_query, cursor, size)
+        except InvalidCursor as e:
+            return jsonify({"code": 400, "msg": str(e)}), 400
+    else:
+        orders, total, _ = paginate_with_archive(query, archive_query, page, size)
+    
+    # 处理订单数据，订单项、商品信息批量加载
+    orders_list = serialize_mini_orders(orders)
+    
+    if cursor is not None:
+        return jsonify({
+            "code": 200,
+            "msg": "成功",
+            "data": {
+                "list": orders_list,
+                "next_cursor": next_cursor
             }
-            items.append(item_data)
-        
-        order_data = {
-            "order_id": order.id,
-            "order_number": order.order_number,
-            "status": order.status,
-            "status_text": {
-                "pending": "待付款",
-                "paid": "已支付",
-                "shipped": "已发货",
-                "delivered": "已送达",
-                "canceled": "已取消"
-            }.get(order.status, "未知状态"),
-            "total_amount": round(float(order.total_amount), 2) if order.total_amount else 0,
-            "create_time": order.created_at.strftime("%Y-%m-%d %H:%M:%S") if order.created_at else "",
-            "items": items
-        }
-        orders_list.append(order_data)
+        })
     
     return jsonify({
         "code": 200,
         "msg": "成功",
         "data": {
-            "total": pagination.total,
+            "total": total,
             "list": orders_list
         }
     })
 
 @bp.route('/create', methods=['POST'])
+@idempotent
 def create_order_api():
     """创建订单 - 小程序专用接口"""
     # 从请求头获取Token
@@ -300,81 +320,85 @@ def create_order_api():
     if 'address_id' not in data or 'items' not in data or not data['items']:
         return jsonify({"code": 400, "msg": "缺少必要参数"}), 400
     
-    address_id = data['address_id']
-    items_data = data['items']
-    
     # 创建订单
-    new_order = Order(
-        user_id=user_id,
-        address_id=address_id,
-        order_number=generate_order_number(),
-        status='pending',
-        total_amount=0
-    )
+    try:
+        new_order = place_order(
+            user_id, data['address_id'], data['items'],
+            order_number=generate_order_number()
+        )
+    except OrderError as e:
+        return jsonify({"code": 400, "msg": str(e)}), 400
+    except Exception as e:
+        return jsonify({"code": 500, "msg": f"创建订单失败: {str(e)}"}), 500
     
-    # 添加订单项
-    total_amount = 0
-    order_items = []
+    return jsonify({
+        "code": 200,
+        "msg": "订单创建成功",
+        "data": {
+            "order_id": new_order.id,
+            "order_number": new_order.order_number,
+            "total_amount": round(float(new_order.total_amount), 2)
+        }
+    })
+
+@bp.route('/checkout', methods=['POST'])
+@idempotent
+def checkout_api():
+    """购物车结算 - 小程序专用接口，选中的购物车项下单后从购物车中删除"""
+    # 从请求头获取Token
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return jsonify({"code": 401, "msg": "未授权，请先登录"}), 401
     
-    for item_data in items_data:
-        product_id = item_data.get('product_id')
-        quantity = item_data.get('quantity', 1)
-        
-        if not product_id or not quantity:
-            continue
-        
-        # 查询产品
-        product = Product.query.get(product_id)
-        if not product:
-            return jsonify({"code": 400, "msg": f"商品ID {product_id} 不存在"}), 400
-        
-        # 检查库存
-        if product.stock < quantity:
-            return jsonify({"code": 400, "msg": f"商品 {product.name} 库存不足"}), 400
-        
-        # 减少库存
-        product.stock -= quantity
-        
-        # 创建订单项
-        order_item = OrderItem(
-            product_id=product_id,
-            quantity=quantity,
-            price=product.price
-        )
-        
-        # 计算小计
-        item_total = product.price * quantity
-        total_amount += item_total
-        
-        order_items.append(order_item)
+    token = auth_header.split(' ')[1]
+    
+    # 从token中提取用户ID
+    try:
+        if ':' in token:
+            user_id = int(token.split(':')[0])
+        else:
+            user_id = int(token)
+    except:
+        return jsonify({"code": 401, "msg": "无效的用户身份，请重新登录"}), 401
+    
+    # 检查用户是否存在
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"code": 404, "msg": "用户不存在"}), 404
     
-    # 更新订单总额
-    new_order.total_amount = total_amount
+    # 获取请求数据：cart_item_ids、address_id，expected_total 为客户端展示的应付金额（可选）
+    data = request.get_json() or {}
+    cart_item_ids = data.get('cart_item_ids')
+    if not data.get('address_id') or not isinstance(cart_item_ids, list) or not cart_item_ids:
+        return jsonify({"code": 400, "msg": "缺少必要参数"}), 400
+    if not all(isinstance(item_id, int) for item_id in cart_item_ids):
+        return jsonify({"code": 400, "msg": "购物车项ID格式错误"}), 400
+    expected_total = data.get('expected_total')
+    if expected_total is not None and not isinstance(expected_total, (int, float)):
+        return jsonify({"code": 400, "msg": "应付金额格式错误"}), 400
     
-    # 保存订单
     try:
-        db.session.add(new_order)
-        db.session.flush()  # 获取订单ID
-        
-        # 关联订单项
-        for item in order_items:
-            item.order_id = new_order.id
-            db.session.add(item)
-        
-        db.session.commit()
-        
-        return jsonify({
-            "code": 200,
-            "msg": "订单创建成功",
-            "data": {
-                "order_id": new_order.id,
-                "order_number": new_order.order_number,
-                "total_amount": round(float(new_order.total_amount), 2)
-            }
-        })
+        # memory 购物车后端中尚未写回的数量修改先写入数据库
+        get_cart_store().flush(user_id)
+        new_order = checkout_cart(
+            user_id, data['address_id'], cart_item_ids,
+            order_number=generate_order_number(),
+            expected_total=expected_total
+        )
+    except OrderError as e:
+        return jsonify({"code": 400, "msg": str(e)}), 400
     except Exception as e:
-        db.session.rollback()
-        return jsonify({"code": 500, "msg": f"创建订单失败: {str(e)}"}), 500 
+        return jsonify({"code": 500, "msg": f"结算失败: {str(e)}"}), 500
+    
+    return jsonify({
+        "code": 200,
+        "msg": "订单创建成功",
+        "data": {
+            "order_id": new_order.id,
+            "order_number": new_order.order_number,
+            "total_amount": round(float(new_order.total_amount), 2)
+        }
+    })
 
 @bp.route('/detail', methods=['GET'])
 def get_order_detail_api():
@@ -407,72 +431,11 @@ def get_order_detail_api():
     if not order_id:
         return jsonify({"code": 400, "msg": "缺少订单ID参数"}), 400
     
-    # 查询订单
-    order = Order.query.filter_by(id=order_id, user_id=user_id).first()
-    if not order:
+    # 按主键读取订单详情快照，不在 orders 中时查询归档表
+    order_data = order_detail(order_id, user_id)
+    if not order_data:
         return jsonify({"code": 404, "msg": "订单不存在或无权查看"}), 404
     
-    # 获取收货地址
-    address_info = None
-    if order.address_id:
-        address = Address.query.get(order.address_id)
-        if address:
-            address_info = {
-                "id": address.id,
-                "name": address.name,
-                "phone": address.phone,
-                "province": address.province,
-                "city": address.city,
-                "district": address.district,
-                "detail": address.detail,
-                "is_default": address.is_default
-            }
-    
-    # 获取订单项
-    items = []
-    for item in order.items:
-        try:
-            product = Product.query.get(item.product_id)
-            product_name = product.name if product else "未知商品"
-            product_image = ""
-            if product and product.images and product.images[0]:
-                image_url = product.images[0].url
-                product_image = f"https://web-production-85aa.up.railway.app{image_url}" if image_url.startswith('/') else image_url
-        except Exception as e:
-            print(f"获取商品信息失败: {str(e)}")
-            product_name = "商品信息获取失败"
-            product_image = ""
-        
-        item_data = {
-            "id": item.id,
-            "product_id": item.product_id,
-            "name": product_name,
-            "image": product_image,
-            "price": float(item.price) if item.price else 0,
-            "quantity": item.quantity,
-            "total": float(item.price * item.quantity) if item.price else 0
-        }
-        items.append(item_data)
-    
-    # 构建订单详情
-    order_data = {
-        "order_id": order.id,
-        "order_number": order.order_number,
-        "status": order.status,
-        "status_text": {
-            "pending": "待付款",
-            "paid": "已支付",
-            "shipped": "已发货",
-            "delivered": "已送达",
-            "canceled": "已取消"
-        }.get(order.status, "未知状态"),
-        "total_amount": round(float(order.total_amount), 2) if order.total_amount else 0,
-        "create_time": order.created_at.strftime("%Y-%m-%d %H:%M:%S") if order.created_at else "",
-        "update_time": order.updated_at.strftime("%Y-%m-%d %H:%M:%S") if order.updated_at else "",
-        "address": address_info,
-        "items": items
-    }
-    
     return jsonify({
         "code": 200,
         "msg": "成功",
@@ -480,6 +443,7 @@ def get_order_detail_api():
     })
 
 @bp.route('/pay', methods=['POST'])
+@idempotent
 def pay_order_api():
     """订单支付 - 小程序专用接口"""
     # 从请求头获取Token
@@ -536,6 +500,7 @@ def pay_order_api():
         # 更改订单状态
         order.status = 'paid'
         order.updated_at = datetime.datetime.now()
+        refresh_detail_snapshots([order.id])
         
         db.session.commit()
         
@@ -602,6 +567,7 @@ def confirm_order_api():
         # 更改订单状态
         order.status = 'delivered'
         order.updated_at = datetime.datetime.now()
+        refresh_detail_snapshots([order.id])
         
         db.session.commit()
         
@@ -1,131 +1,242 @@
-from flask import Blueprint, request, jsonify
-from app.models.product import Product, ProductImage
+from flask import Blueprint, request, jsonify, current_app
+from app.models.product import Product, ProductImage, Category, Tag, product_tags
+from app.utils import meta, search
+from app.utils.pagination import clamp_page_size, keyset_paginate, InvalidCursor
+from app.utils.cache import catalog_cache, invalidate_products, product_tag
+from app.utils.http_cache import conditional_get, content_version
+from app.utils.categories import resolve_category_id, set_product_category, release_product_category
+from app.utils.tags import set_product_tags, remove_product_tags
+from app.utils.product_import import import_products, detect_format, FORMATS
+from app.utils.serializers import (
+    absolute_url, product_query, serialize_products, product_dict, product_card, product_detail
+)
 from app import db
+import io
 import uuid
 import os
+from datetime import datetime
 
 bp = Blueprint('products', __name__, url_prefix='/api/products')
 
+def _filter_category(query, value):
+    """按分类外键过滤，参数可以是分类 id 或分类名称"""
+    category_id = resolve_category_id(value)
+    if category_id is None:
+        return query.filter(db.false())
+    return query.filter(Product.category_id == category_id)
+
+def _split_param(value):
+    """逗号分隔的多值参数"""
+    return tuple(v.strip() for v in value.split(',') if v.strip()) if value else ()
+
+def _parse_filters(args):
+    """解析价格区间、材质、环保标签、是否有货筛选参数，/api/products 与 /list 共用"""
+    return {
+        'min_price': args.get('min_price', type=float),
+        'max_price': args.get('max_price', type=float),
+        'materials': _split_param(args.get('material')),
+        'eco_labels': _split_param(args.get('eco_labels')),
+        'in_stock': (args.get('in_stock') or '').lower() in ('1', 'true')
+    }
+
+def _apply_filters(query, filters):
+    if filters['min_price'] is not None:
+        query = query.filter(Product.price >= filters['min_price'])
+    if filters['max_price'] is not None:
+        query = query.filter(Product.price <= filters['max_price'])
+    if filters['materials']:
+        query = query.filter(Product.material.in_(filters['materials']))
+    if filters['eco_labels']:
+        # 带有任一所选标签即可
+        tagged = db.session.query(product_tags.c.product_id) \
+            .join(Tag, Tag.id == product_tags.c.tag_id) \
+            .filter(Tag.name.in_(filters['eco_labels']))
+        query = query.filter(Product.id.in_(tagged))
+    if filters['in_stock']:
+        query = query.filter(Product.stock > 0)
+    return query
+
+def _want_facets(args, cursor):
+    """默认返回分面统计，facets=0 关闭；游标分页只在第一页返回"""
+    if (args.get('facets') or '').lower() in ('0', 'false'):
+        return False
+    return not cursor
+
+def _facets(query):
+    """当前筛选结果中各环保标签、材质的商品数，在数据库中分组统计"""
+    matched = query.with_entities(Product.id).order_by(None).subquery()
+    matched_ids = db.select(matched.c.id)
+    
+    label_count = db.func.count(product_tags.c.product_id)
+    labels = db.session.query(Tag.name, label_count) \
+        .join(product_tags, product_tags.c.tag_id == Tag.id) \
+        .filter(product_tags.c.product_id.in_(matched_ids)) \
+        .group_by(Tag.id, Tag.name) \
+        .order_by(label_count.desc(), Tag.name)
+    
+    material_count = db.func.count(Product.id)
+    materials = db.session.query(Product.material, material_count) \
+        .filter(Product.id.in_(matched_ids), Product.material.isnot(None), Product.material != '') \
+        .group_by(Product.material) \
+        .order_by(material_count.desc(), Product.material)
+    
+    return {
+        'eco_labels': [{'name': name, 'count': count} for name, count in labels],
+        'materials': [{'name': name, 'count': count} for name, count in materials]
+    }
+
 @bp.route('', methods=['GET'])
 def get_products():
     # 获取查询参数
     page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    per_page = clamp_page_size(request.args.get('per_page', 10, type=int))
+    cursor = request.args.get('cursor')  # 传入 cursor（首页为空字符串）时使用游标分页
     category = request.args.get('category')
     eco_friendly = request.args.get('eco_friendly')
     
-    # 构建查询
-    query = Product.query
+    # 只查询序列化所需的列，图片在序列化时用一次 IN 查询批量加载
+    query = product_query()
     
     if category:
-        query = query.filter(Product.category == category)
+        query = _filter_category(query, category)
     
     if eco_friendly and eco_friendly.lower() == 'true':
         query = query.filter(Product.eco_friendly == True)
     
+    query = _apply_filters(query, _parse_filters(request.args))
+    facets = _facets(query) if _want_facets(request.args, cursor) else None
+    
     # 执行分页查询
-    pagination = query.order_by(Product.created_at.desc()).paginate(page=page, per_page=per_page)
+    if cursor is not None:
+        try:
+            products, next_cursor = keyset_paginate(query, Product, cursor, per_page)
+        except InvalidCursor as e:
+            return jsonify({'message': str(e)}), 400
+    else:
+        pagination = query.order_by(Product.created_at.desc()).paginate(page=page, per_page=per_page)
+        products = pagination.items
     
-    # 处理产品数据，确保图片URL正确
-    items = []
-    for product in pagination.items:
-        product_dict = product.to_dict()
-        # 确保图片URL是完整的路径
-        if product_dict['images']:
-            product_dict['images'] = [f"https://web-production-85aa.up.railway.app{url}" if url.startswith('/') else url for url in product_dict['images']]
-        items.append(product_dict)
+    # 图片URL转换为完整路径
+    items = serialize_products(products, product_dict, absolute=True)
     
-    return jsonify({
-        'items': items,
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'page': page
-    }), 200
+    if cursor is not None:
+        data = {
+            'items': items,
+            'next_cursor': next_cursor
+        }
+    else:
+        data = {
+            'items': items,
+            'total': pagination.total,
+            'pages': pagination.pages,
+            'page': page
+        }
+    if facets is not None:
+        data['facets'] = facets
+    
+    return jsonify(data), 200
+
+# 商品列表前几页走目录缓存
+LIST_CACHE_PAGES = 3
 
 # 添加与小程序匹配的/list路由
 @bp.route('/list', methods=['GET'])
 def get_products_list():
     # 获取查询参数
     page = request.args.get('page', 1, type=int)
-    size = request.args.get('size', 10, type=int)
+    size = clamp_page_size(request.args.get('size', 10, type=int))
+    cursor = request.args.get('cursor')  # 传入 cursor（首页为空字符串）时使用游标分页
     category_id = request.args.get('category_id')
     keyword = request.args.get('keyword')
+    filters = _parse_filters(request.args)
+    with_facets = _want_facets(request.args, cursor)
     
-    # 构建查询
-    query = Product.query
-    
-    if category_id:
-        query = query.filter(Product.category == category_id)
-    
-    if keyword:
-        query = query.filter(Product.name.contains(keyword) | Product.description.contains(keyword))
+    def load():
+        return _load_products_list(page, size, cursor, category_id, keyword, filters, with_facets)
     
-    # 执行分页查询
-    pagination = query.order_by(Product.created_at.desc()).paginate(page=page, per_page=size)
-    
-    # 处理产品数据
-    products_list = []
-    for item in pagination.items:
-        # 处理图片URL
-        images = [f"https://web-production-85aa.up.railway.app{img.url}" if img.url.startswith('/') else img.url for img in item.images]
-        default_image = "https://web-production-85aa.up.railway.app/static/images/product/default.jpg"
-        
-        product_data = {
-            'product_id': item.id,
-            'name': item.name,
-            'description': item.description,
-            'price': item.price,
-            'category_id': item.category,
-            'category_name': item.category,  # 实际应该从分类表获取名称
-            'image': images[0] if images else default_image,
-            'images': images if images else [default_image],
-            'create_time': item.created_at.strftime('%Y-%m-%d %H:%M:%S') if item.created_at else ''
-        }
-        products_list.append(product_data)
+    try:
+        # 只缓存首页（游标分页）或前几页（普通分页）
+        if cursor == '' or (cursor is None and page <= LIST_CACHE_PAGES):
+            cache_key = ('product_list', page, size, cursor, category_id, keyword,
+                         tuple(sorted(filters.items())), with_facets)
+            # 按是否有货筛选的结果随库存变化，库存变动时一并失效
+            tags = ('product_list', 'product_stock') if filters['in_stock'] else ('product_list',)
+            data = catalog_cache.get_or_load(cache_key, load, tags=tags)
+        else:
+            data = load()
+    except InvalidCursor as e:
+        return jsonify({'code': 400, 'msg': str(e)}), 400
     
     # 返回符合API文档的响应格式
     return jsonify({
         'code': 200,
         'msg': '成功',
-        'data': {
-            'total': pagination.total,
-            'list': products_list
-        }
+        'data': data
     })
 
-# 添加分类接口
-@bp.route('/categories', methods=['GET'])
-def get_categories():
-    # 从数据库获取产品分类
-    categories_query = db.session.query(Product.category).distinct()
-    categories_query = categories_query.filter(Product.category.isnot(None))
+def _load_products_list(page, size, cursor, category_id, keyword, filters, with_facets):
+    """查询小程序商品列表，返回响应中的 data 部分"""
+    # 只查询序列化所需的列，图片在序列化时用一次 IN 查询批量加载
+    query = product_query()
     
-    # 获取分类列表
-    raw_categories = [item[0] for item in categories_query.all() if item[0]]
+    if category_id:
+        query = _filter_category(query, category_id)
     
-    # 组装分类数据
-    categories = []
-    # 图片映射，确保使用服务器上真实存在的图片
-    category_image_map = {
-        'table': '/static/images/category/category_table.png',
-        'chair': '/static/images/category/category_chair.png',
-        'bed': '/static/images/category/category_bed.png'
-    }
+    # 关键词走全文索引，无法使用全文索引时回退到 LIKE
+    matches = search.match_subquery(keyword) if keyword else None
+    if matches is not None:
+        query = query.join(matches, matches.c.product_id == Product.id)
+    elif keyword:
+        query = query.filter(Product.name.contains(keyword) | Product.description.contains(keyword))
     
-    for i, cat_name in enumerate(raw_categories, start=1):
-        # 确定图片路径
-        lower_cat = cat_name.lower()
-        if lower_cat in category_image_map:
-            image_path = category_image_map[lower_cat]
+    query = _apply_filters(query, filters)
+    facets = _facets(query) if with_facets else None
+    
+    # 执行分页查询：游标分页按创建时间排序，普通分页有关键词时按相关度排序
+    if cursor is not None:
+        products, next_cursor = keyset_paginate(query, Product, cursor, size)
+    else:
+        if matches is not None:
+            query = query.order_by(matches.c.score, Product.created_at.desc())
         else:
-            image_path = '/static/images/category/category_default.png'
-        
-        category = {
-            'category_id': cat_name,
-            'category_name': cat_name,
-            'image': f"https://web-production-85aa.up.railway.app{image_path}"
+            query = query.order_by(Product.created_at.desc())
+        pagination = query.paginate(page=page, per_page=size)
+        products = pagination.items
+    
+    products_list = serialize_products(products, product_card)
+    
+    if cursor is not None:
+        data = {
+            'list': products_list,
+            'next_cursor': next_cursor
+        }
+    else:
+        data = {
+            'total': pagination.total,
+            'list': products_list
         }
-        categories.append(category)
+    if facets is not None:
+        data['facets'] = facets
+    return data
+
+def _catalog_version():
+    """分类列表的内容版本：categories 表变更时递增的计数器，一次主键查询"""
+    return meta.get_value(meta.CATALOG_VERSION)
+
+def _product_version(id=None):
+    """单个商品的内容版本，商品不存在时返回 None"""
+    if id is None:
+        id = request.args.get('product_id', type=int)
+    if not id:
+        return None
+    row = db.session.query(Product.id, Product.updated_at).filter_by(id=id).first()
+    return tuple(row) if row else None
+
+# 添加分类接口
+@bp.route('/categories', methods=['GET'])
+@conditional_get(version=_catalog_version, max_age=60)
+def get_categories():
+    categories = catalog_cache.get_or_load(('categories', content_version()), _load_categories, tags=('categories',))
     
     return jsonify({
         'code': 200,
@@ -133,48 +244,108 @@ def get_categories():
         'data': categories
     })
 
+def _load_categories():
+    # 分类及商品数由 categories 表维护，只返回有商品的分类
+    categories = []
+    for category in Category.query.filter(Category.product_count > 0).order_by(Category.id).all():
+        image_path = category.image or '/static/images/category/category_default.png'
+        categories.append({
+            'category_id': category.id,
+            'category_name': category.name,
+            'product_count': category.product_count,
+            'image': absolute_url(image_path)
+        })
+    
+    return categories
+
 @bp.route('/<int:id>', methods=['GET'])
+@conditional_get(version=_product_version)
 def get_product(id):
-    product = Product.query.get(id)
+    def load():
+        row = product_query().filter(Product.id == id).first()
+        return serialize_products([row], product_dict)[0] if row else None
     
-    if not product:
+    product_data = catalog_cache.get_or_load(('product', id, content_version()), load, tags=(product_tag(id),))
+    if not product_data:
         return jsonify({'message': '产品不存在'}), 404
     
-    return jsonify(product.to_dict()), 200
+    return jsonify(product_data), 200
 
 # 添加与小程序匹配的/detail路由
 @bp.route('/detail', methods=['GET'])
+@conditional_get(version=_product_version)
 def get_product_detail():
-    product_id = request.args.get('product_id')
+    product_id = request.args.get('product_id', type=int)
     if not product_id:
         return jsonify({'code': 400, 'msg': '缺少商品ID参数'}), 400
     
-    product = Product.query.get(product_id)
-    if not product:
+    product_data = catalog_cache.get_or_load(
+        ('product_detail', product_id, content_version()),
+        lambda: _load_product_detail(product_id),
+        tags=(product_tag(product_id),)
+    )
+    if not product_data:
         return jsonify({'code': 404, 'msg': '商品不存在'}), 404
     
-    # 处理图片URL
-    images = [f"https://web-production-85aa.up.railway.app{img.url}" if img.url.startswith('/') else img.url for img in product.images]
-    default_image = "https://web-production-85aa.up.railway.app/static/images/product/default.jpg"
-    
     # 返回符合API文档的响应格式
+    return jsonify({
+        'code': 200,
+        'msg': '成功',
+        'data': product_data
+    })
+
+def _load_product_detail(product_id):
+    """查询小程序商品详情，商品不存在时返回 None"""
+    row = product_query().filter(Product.id == product_id).first()
+    if not row:
+        return None
+    return serialize_products([row], product_detail)[0]
+
+# 批量查询商品详情，供购物车、订单、浏览记录等页面一次取回多个商品
+@bp.route('/batch', methods=['GET'])
+@conditional_get()
+def get_products_batch():
+    values = _split_param(request.args.get('ids'))
+    if not values:
+        return jsonify({'code': 400, 'msg': '缺少商品ID参数'}), 400
+    if not all(value.isdigit() for value in values):
+        return jsonify({'code': 400, 'msg': '商品ID格式错误'}), 400
+    
+    ids = list(dict.fromkeys(int(value) for value in values))
+    max_ids = current_app.config['MAX_BATCH_IDS']
+    if len(ids) > max_ids:
+        return jsonify({'code': 400, 'msg': f'一次最多查询 {max_ids} 个商品'}), 400
+    
+    # 先取各商品的内容版本（与 /detail 的 ETag 版本相同），按版本取目录缓存（与 /detail 共用），
+    # 未命中的用一次 IN 查询和一次图片查询加载；不存在的商品不再查询
+    product_versions = {
+        row.id: tuple(row)
+        for row in db.session.query(Product.id, Product.updated_at).filter(Product.id.in_(ids))
+    }
+    items = {}
+    misses = []
+    for product_id, product_version in product_versions.items():
+        cached = catalog_cache.get(('product_detail', product_id, product_version))
+        if cached:
+            items[product_id] = cached
+        else:
+            misses.append(product_id)
+    
+    if misses:
+        versions = {product_id: catalog_cache.tag_versions((product_tag(product_id),)) for product_id in misses}
+        rows = product_query().filter(Product.id.in_(misses)).all()
+        for data in serialize_products(rows, product_detail):
+            product_id = data['product_id']
+            items[product_id] = data
+            catalog_cache.set(('product_detail', product_id, product_versions[product_id]), data,
+                              tags=(product_tag(product_id),), versions=versions[product_id])
+    
     return jsonify({
         'code': 200,
         'msg': '成功',
         'data': {
-            'product_id': product.id,
-            'name': product.name,
-            'description': product.description,
-            'content': product.description,
-            'price': product.price,
-            'category_id': product.category,
-            'category_name': product.category,
-            'material': product.material,
-            'carbon_footprint': product.carbon_footprint,
-            'eco_labels': product.eco_labels.split(',') if product.eco_labels else [],
-            'image': images[0] if images else default_image,
-            'images': images if images else [default_image],
-            'create_time': product.created_at.strftime('%Y-%m-%d %H:%M:%S') if product.created_at else ''
+            'items': {str(product_id): items[product_id] for product_id in ids if product_id in items},
+            'missing': [product_id for product_id in ids if product_id not in items]
         }
     })
 
@@ -192,15 +363,14 @@ def create_product():
         description=data.get('description'),
         price=data['price'],
         stock=data.get('stock', 0),
-        category=data.get('category'),
         eco_friendly=data.get('eco_friendly', False),
-        eco_labels=','.join(data.get('eco_labels', [])) if isinstance(data.get('eco_labels'), list) else data.get('eco_labels', ''),
         material=data.get('material'),
         carbon_footprint=data.get('carbon_footprint')
     )
     
     try:
         db.session.add(product)
+        set_product_category(product, data.get('category'))
         
         # 处理产品图片
         if 'images' in data and isinstance(data['images'], list):
@@ -212,7 +382,13 @@ def create_product():
                 )
                 db.session.add(image)
         
+        # 同步环保标签和全文索引
+        db.session.flush()
+        set_product_tags(product, data.get('eco_labels'))
+        search.index_product(product)
+        
         db.session.commit()
+        invalidate_products([product.id], catalog_changed=True)
         return jsonify({
             'message': '产品创建成功',
             'product': product.to_dict()
@@ -221,6 +397,34 @@ def create_product():
         db.session.rollback()
         return jsonify({'message': f'产品创建失败: {str(e)}'}), 500
 
+@bp.route('/import', methods=['POST'])
+def import_products_api():
+    """批量导入/更新商品 - 管理员功能
+
+    上传 multipart 文件（字段 file）或直接以请求体发送文件内容，
+    格式由 format 参数或文件扩展名确定（csv / jsonl）。
+    """
+    upload = request.files.get('file')
+    fmt = request.args.get('format') or detect_format(upload.filename if upload else None)
+    if fmt not in FORMATS:
+        return jsonify({'code': 400, 'msg': '无法识别导入格式，请指定 format=csv 或 format=jsonl'}), 400
+    
+    # 以文本流方式逐行读取，不把整个文件读入内存
+    raw = upload.stream if upload else request.stream
+    stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    
+    try:
+        report = import_products(stream, fmt)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'code': 500, 'msg': f'导入失败: {str(e)}'}), 500
+    
+    return jsonify({
+        'code': 200,
+        'msg': '导入完成',
+        'data': report.to_dict()
+    })
+
 @bp.route('/<int:id>', methods=['PUT'])
 def update_product(id):
     product = Product.query.get(id)
@@ -240,11 +444,11 @@ def update_product(id):
     if 'stock' in data:
         product.stock = data['stock']
     if 'category' in data:
-        product.category = data['category']
+        set_product_category(product, data['category'])
     if 'eco_friendly' in data:
         product.eco_friendly = data['eco_friendly']
     if 'eco_labels' in data:
-        product.eco_labels = ','.join(data['eco_labels']) if isinstance(data['eco_labels'], list) else data['eco_labels']
+        set_product_tags(product, data['eco_labels'])
     if 'material' in data:
         product.material = data['material']
     if 'carbon_footprint' in data:
@@ -266,7 +470,14 @@ def update_product(id):
                 )
                 db.session.add(image)
         
+        # 图片、标签、分类不一定修改 products 行本身，显式更新 updated_at，商品详情的 ETag 随之变化
+        product.updated_at = datetime.utcnow()
+        
+        # 同步全文索引
+        search.index_product(product)
+        
         db.session.commit()
+        invalidate_products([id], catalog_changed=True)
         return jsonify({
             'message': '产品更新成功',
             'product': product.to_dict()
@@ -286,12 +497,12 @@ def delete_product(id):
         return jsonify({'message': '产品不存在'}), 404
     
     try:
-        # 检查是否有订单项引用此产品
-        from app.models.order import OrderItem
-        order_items = OrderItem.query.filter_by(product_id=id).all()
+        # 检查是否有订单项引用此产品（包括已归档的订单）
+        from app.models.order import OrderItem, OrderItemArchive
+        order_count = OrderItem.query.filter_by(product_id=id).count() \
+            + OrderItemArchive.query.filter_by(product_id=id).count()
         
-        if order_items:
-            order_count = len(order_items)
+        if order_count:
             print(f"产品ID {id} ({product.name}) 被 {order_count} 个订单项引用，无法直接删除")
             return jsonify({
                 'message': f'无法删除产品，该产品已被 {order_count} 个订单引用。请先删除相关订单或将订单中的产品替换为其他产品。',
@@ -303,8 +514,12 @@ def delete_product(id):
         
         # 删除产品
         print(f"开始删除产品: {product.name}")
+        release_product_category(product)
+        remove_product_tags(id)
         db.session.delete(product)
+        search.remove_product(id)
         db.session.commit()
+        invalidate_products([id], catalog_changed=True)
         print(f"产品 {product.name} 删除成功")
         
         return jsonify({'message': '产品删除成功'}), 200
@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask import Blueprint, request, jsonify
 from app.models.user import User, Address
-from app.models.order import Order
+from app.models.order import Order, OrderArchive
 from app import db
+from app.utils.idempotency import idempotent
 
 bp = Blueprint('user', __name__, url_prefix='/api/user')
 
@@ -246,8 +247,9 @@ def delete_address(id):
     if not address:
         return jsonify({"code": 404, "msg": "地址不存在或无权访问"}), 404
 
-    # ✅ 新增：检查是否有订单使用该地址
-    linked_order = Order.query.filter_by(address_id=id).first()
+    # ✅ 新增：检查是否有订单使用该地址（包括已归档的订单）
+    linked_order = Order.query.filter_by(address_id=id).first() \
+        or OrderArchive.query.filter_by(address_id=id).first()
     if linked_order:
         return jsonify({"code": 400, "msg": "该地址已关联订单，无法删除"}), 400
 
@@ -273,6 +275,7 @@ def delete_address(id):
 
 
 @bp.route('/charge', methods=['POST'])
+@idempotent
 def charge():
     """用户充值"""
     # 从请求头获取Token
@@ -0,0 +1,175 @@
+"""订单冷热分离
+
+已送达、已取消且创建时间早于 ORDER_ARCHIVE_DAYS 天的订单连同订单项分批移入
+orders_archive / order_items_archive，orders 表只保留近期和未完结的订单。
+
+订单列表和详情接口先查 orders，需要更早的数据时再查归档表：
+- 游标分页：本页可能包含归档订单时（本页不满，或本页最后一条早于归档表中最新的订单），
+  用同一个游标再查一次归档表并合并排序
+- 普通分页：与游标分页顺序相同，本页可能包含归档订单时两表各取到本页末尾合并排序，
+  总数为两表之和（可选）
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, insert, select, text
+from app import db
+from app.models.order import Order, OrderItem, OrderArchive, OrderItemArchive
+from app.utils.pagination import keyset_paginate, encode_cursor
+
+ARCHIVE_STATUSES = ('delivered', 'canceled')
+
+BATCH_SIZE = 500
+
+
+def _shared_columns(source, target):
+    """两张表共有的列名，归档表按列名复制数据"""
+    return [column.name for column in source.columns if column.name in target.columns]
+
+
+def archive_orders(days=None, batch_size=BATCH_SIZE):
+    """把超过保留期的已完结订单移入归档表，返回归档的订单数"""
+    if days is None:
+        days = current_app.config['ORDER_ARCHIVE_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    orders, items = Order.__table__, OrderItem.__table__
+    order_columns = _shared_columns(orders, OrderArchive.__table__)
+    item_columns = _shared_columns(items, OrderItemArchive.__table__)
+
+    archived = 0
+    while True:
+        ids = db.session.execute(
+            select(Order.id)
+            .where(Order.status.in_(ARCHIVE_STATUSES), Order.created_at < cutoff)
+            .order_by(Order.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        now = datetime.utcnow()
+        try:
+            db.session.execute(insert(OrderArchive.__table__).from_select(
+                order_columns + ['archived_at'],
+                select(*[orders.c[name] for name in order_columns], db.literal(now))
+                .where(orders.c.id.in_(ids))
+            ))
+            db.session.execute(insert(OrderItemArchive.__table__).from_select(
+                item_columns,
+                select(*[items.c[name] for name in item_columns]).where(items.c.order_id.in_(ids))
+            ))
+            db.session.execute(delete(items).where(items.c.order_id.in_(ids)))
+            db.session.execute(delete(orders).where(orders.c.id.in_(ids)))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        archived += len(ids)
+        print(f"已归档 {archived} 个订单")
+    return archived
+
+
+def ensure_autoincrement_ids():
+    """迁移：orders、order_items 的主键使用 AUTOINCREMENT，自增序列不小于归档表中的最大 id
+
+    没有 AUTOINCREMENT 时 SQLite 按当前最大 id + 1 分配新 id，最大 id 的行被删除后，
+    新订单、订单项会复用已归档的 id，与归档表冲突。
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    from app.utils.schema import rebuild_sqlite_table
+    for table, archive in ((Order.__table__, OrderArchive.__table__),
+                           (OrderItem.__table__, OrderItemArchive.__table__)):
+        sql = db.session.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': table.name}
+        ).scalar()
+        if 'AUTOINCREMENT' not in (sql or '').upper():
+            rebuild_sqlite_table(table)
+        db.session.execute(text(
+            'INSERT INTO sqlite_sequence (name, seq) SELECT :name, 0 '
+            'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)'
+        ), {'name': table.name})
+        db.session.execute(text(
+            'UPDATE sqlite_sequence SET seq = max(seq, '
+            f'(SELECT coalesce(max(id), 0) FROM {table.name}), '
+            f'(SELECT coalesce(max(id), 0) FROM {archive.name})) '
+            'WHERE name = :name'
+        ), {'name': table.name})
+
+
+def archive_horizon():
+    """归档表中最新订单的创建时间，归档表为空时返回 None"""
+    return db.session.query(db.func.max(OrderArchive.created_at)).scalar()
+
+
+def _sort_key(row):
+    # 与 keyset_paginate 的排序一致：created_at DESC, id DESC，created_at 为 NULL 的排在最后
+    return (row.created_at is not None, row.created_at or datetime.min, row.id)
+
+
+def keyset_paginate_with_archive(live_query, archive_query, cursor, size):
+    """游标分页，需要时合并归档表的结果，返回 (rows, next_cursor)"""
+    rows, next_cursor = keyset_paginate(live_query, Order, cursor, size)
+    horizon = archive_horizon()
+    if horizon is None:
+        return rows, next_cursor
+    # 本页已满且最后一条比所有归档订单都新，归档表中不会有订单落在本页
+    if next_cursor and rows[-1].created_at is not None and rows[-1].created_at > horizon:
+        return rows, next_cursor
+
+    archived, archive_cursor = keyset_paginate(archive_query, OrderArchive, cursor, size)
+    merged = sorted(rows + archived, key=_sort_key, reverse=True)
+    has_more = len(merged) > size or next_cursor is not None or archive_cursor is not None
+    merged = merged[:size]
+    if has_more and merged:
+        return merged, encode_cursor(merged[-1].created_at, merged[-1].id)
+    return merged, None
+
+
+def paginate_with_archive(live_query, archive_query, page, size, with_total=True):
+    """普通分页，orders 与归档订单按 created_at DESC, id DESC 合并排序，返回 (rows, total, has_more)
+
+    顺序与游标分页相同。本页最后一条比所有归档订单都新时只需查 orders；否则两表各取前
+    start + size 条合并后截取本页，页码越靠后读取的行越多。
+    with_total 为 False 时不统计总数（total 为 None），多取一条判断是否还有下一页。
+    """
+    page = max(page, 1)
+    start = (page - 1) * size
+    live_order = (Order.created_at.desc(), Order.id.desc())
+    archive_order = (OrderArchive.created_at.desc(), OrderArchive.id.desc())
+
+    def merge():
+        limit = start + size + 1
+        merged = sorted(live_query.order_by(*live_order).limit(limit).all()
+                        + archive_query.order_by(*archive_order).limit(limit).all(),
+                        key=_sort_key, reverse=True)
+        return merged[start:start + size], len(merged) > start + size
+
+    total = None
+    if with_total:
+        live_total = live_query.order_by(None).count()
+        archive_total = archive_query.order_by(None).count()
+        total = live_total + archive_total
+        if not archive_total:
+            rows = live_query.order_by(*live_order).offset(start).limit(size).all()
+            return rows, total, start + len(rows) < total
+        # orders 中的订单填不满本页，本页一定包含归档订单
+        if start + size > live_total:
+            rows, _ = merge()
+            return rows, total, start + size < total
+
+    rows = live_query.order_by(*live_order).offset(start).limit(size + 1).all()
+    horizon = archive_horizon()
+    if horizon is None:
+        return rows[:size], total, len(rows) > size
+    # 本页已满且最后一条比所有归档订单都新，本页及之前的位置都是 orders 中的订单
+    last = rows[size - 1] if len(rows) >= size else None
+    if last is not None and last.created_at is not None and last.created_at > horizon:
+        if with_total:
+            return rows[:size], total, start + size < total
+        has_more = len(rows) > size or archive_query.order_by(None).first() is not None
+        return rows[:size], None, has_more
+
+    rows, has_more = merge()
+    return rows, total, has_more
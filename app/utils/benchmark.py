@@ -0,0 +1,150 @@
+"""接口性能基准（run.py 中 bench-product-list、bench-cart-list 命令的实现）
+
+每个基准新建临时 SQLite 数据库并批量造数据，通过测试客户端请求接口，
+统计每次请求的 SQL 语句数和平均 CPU 耗时（time.process_time）；不读写实例数据库，
+商品目录缓存关闭。
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import jsonify
+from sqlalchemy import event, insert
+from sqlalchemy.orm import selectinload
+from app import create_app, db
+from app.models.cart import CartItem
+from app.models.order import Order, OrderItem
+from app.models.product import Product, ProductImage
+from app.utils import init_db
+from app.utils.order_number import generate_order_number
+from app.utils.serializers import absolute_url
+from app.utils.tags import set_tags_many
+
+
+@contextmanager
+def _temp_app():
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'bench.sqlite'),
+            'CATALOG_CACHE_TTL': 0,
+        })
+        try:
+            with app.app_context():
+                init_db.create_test_users()
+                yield app
+        finally:
+            with app.app_context():
+                db.session.remove()
+                db.engine.dispose()
+
+
+def _insert_products(count, images_per_product=3):
+    """批量插入商品（带图片和环保标签），返回商品 id 列表"""
+    now = datetime.utcnow()
+    ids = db.session.execute(
+        insert(Product).returning(Product.id, sort_by_parameter_order=True),
+        [{'name': f'基准商品{i}', 'description': '竹制环保家具' * 20, 'price': 10 + i % 500,
+          'stock': i % 7, 'category': '收纳', 'eco_friendly': True, 'material': '竹',
+          'carbon_footprint': 1.5, 'created_at': now - timedelta(seconds=i), 'updated_at': now}
+         for i in range(count)]
+    ).scalars().all()
+    db.session.execute(insert(ProductImage), [
+        {'product_id': product_id, 'url': f'/static/images/product/{product_id}_{j}.jpg', 'is_primary': j == 0}
+        for product_id in ids for j in range(images_per_product)
+    ])
+    set_tags_many({product_id: ['可回收', '低碳'] for product_id in ids})
+    db.session.commit()
+    return ids
+
+
+def _timed(func, rounds):
+    """调用 func rounds 次，返回 (最后一次的返回值, 每次调用的语句数, 平均 CPU 耗时毫秒)"""
+    func()  # 预热
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        start = time.process_time()
+        for _ in range(rounds):
+            result = func()
+        elapsed = time.process_time() - start
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return result, len(statements) // rounds, elapsed / rounds * 1000
+
+
+def _measure(app, url, rounds, headers=None):
+    """请求 url rounds 次，返回 (最后一次响应, 每次请求的语句数, 平均 CPU 耗时毫秒)"""
+    client = app.test_client()
+    return _timed(lambda: client.get(url, headers=headers), rounds)
+
+
+def _orm_product_page(app, page_size):
+    """对照组：改用列投影之前 /api/products 的做法，ORM 分页加载整行对象后逐个 to_dict()"""
+    with app.test_request_context():
+        pagination = (Product.query.options(selectinload(Product.images))
+                      .order_by(Product.created_at.desc())
+                      .paginate(page=1, per_page=page_size, error_out=False))
+        items = []
+        for product in pagination.items:
+            item = product.to_dict()
+            item['images'] = [absolute_url(url) for url in item['images']]
+            items.append(item)
+        return jsonify({'items': items, 'total': pagination.total, 'pages': pagination.pages, 'page': 1})
+
+
+def product_list_benchmark(products=1000, orders=500, page_size=100, rounds=50):
+    """商品列表、管理端订单列表的序列化开销，返回 [(url, 每次请求的语句数, 平均 CPU 耗时毫秒)]
+
+    第一行是同一页商品按 ORM 整行加载、逐个 to_dict() 的对照结果。
+    """
+    with _temp_app() as app:
+        product_ids = _insert_products(products)
+        now = datetime.utcnow()
+        order_ids = db.session.execute(
+            insert(Order).returning(Order.id, sort_by_parameter_order=True),
+            [{'user_id': 2, 'address_id': 1, 'order_number': generate_order_number(), 'status': 'paid',
+              'total_amount': 30, 'created_at': now - timedelta(minutes=i), 'updated_at': now}
+             for i in range(orders)]
+        ).scalars().all()
+        db.session.execute(insert(OrderItem), [
+            {'order_id': order_id, 'product_id': product_ids[(order_id + j) % len(product_ids)],
+             'quantity': 1, 'price': 10, 'product_name': '基准商品'}
+            for order_id in order_ids for j in range(3)
+        ])
+        db.session.commit()
+
+        # 对照组在新的应用上下文中执行，与请求一样每次使用新的 session
+        def orm_page():
+            with app.app_context():
+                return _orm_product_page(app, page_size)
+
+        _, queries, ms = _timed(orm_page, rounds)
+        results = [(f'ORM paginate + to_dict（对照，{page_size} 条）', queries, ms)]
+        for url in (f'/api/products?per_page={page_size}',
+                    f'/api/products/list?size={page_size}',
+                    f'/api/products/list?size={page_size}&cursor=',
+                    f'/api/orders?per_page={page_size}'):
+            _, queries, ms = _measure(app, url, rounds)
+            results.append((url, queries, ms))
+        return results
+
+
+def cart_list_benchmark(items=300, other_users=300, rounds=20):
+    """购物车列表：一个用户购物车中有 items 件商品，返回 (商品数, 每次请求的语句数, 平均 CPU 耗时毫秒)"""
+    with _temp_app() as app:
+        product_ids = _insert_products(max(items, 20), images_per_product=2)
+        rows = [{'user_id': 2, 'product_id': product_id, 'quantity': 2} for product_id in product_ids[:items]]
+        # 其他用户的购物车，检验按 user_id 的索引查询
+        rows += [{'user_id': 1000 + user, 'product_id': product_id, 'quantity': 1}
+                 for user in range(other_users) for product_id in product_ids[:20]]
+        db.session.execute(insert(CartItem), rows)
+        db.session.commit()
+
+        response, queries, ms = _measure(app, '/api/cart/list', rounds, headers={'Authorization': 'Bearer 2:0'})
+        return len(response.get_json()['data']), queries, ms
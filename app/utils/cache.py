@@ -0,0 +1,163 @@
+"""进程内缓存
+
+TTLCache 同时按过期时间和容量（LRU）淘汰条目，支持：
+- 按标签失效：写入时为条目打上标签（如 product:5），变更后按标签精确清除
+- 单飞加载：同一 key 未命中时只有一个线程执行加载，其余线程等待其结果，
+  避免热点商品失效瞬间大量相同查询同时打到数据库
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+# 等待其他线程加载的最长时间（秒），超时后自行加载
+LOAD_WAIT_TIMEOUT = 5
+
+
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tag_keys = {}  # tag -> set(key)
+        self._tag_versions = {}  # tag -> 失效次数，用于丢弃加载期间已失效的结果
+        self._inflight = {}  # key -> threading.Event
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize=None, ttl=None):
+        """调整容量与过期时间，并清空现有条目"""
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._data.clear()
+            self._tag_keys.clear()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._get_locked(key)
+        return default if value is _MISSING else value
+
+    def set(self, key, value, tags=(), versions=None):
+        """写入缓存；versions 为加载前 tag_versions(tags) 的结果，期间标签被失效过则不写入"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if versions is None or versions == self._tag_snapshot(tags):
+                self._set_locked(key, value, tags)
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return self._tag_snapshot(tags)
+
+    def get_or_load(self, key, loader, tags=()):
+        """读取缓存，未命中时调用 loader 加载并写入；loader 返回 None 时不缓存"""
+        if not self.enabled:
+            return loader()
+
+        while True:
+            with self._lock:
+                value = self._get_locked(key)
+                if value is not _MISSING:
+                    return value
+                event = self._inflight.get(key)
+                owner = event is None
+                if owner:
+                    event = threading.Event()
+                    self._inflight[key] = event
+                    versions = self._tag_snapshot(tags)
+
+            if owner:
+                break
+            # 等待加载中的线程；加载失败时下一轮由某个等待者接手
+            if not event.wait(LOAD_WAIT_TIMEOUT):
+                return loader()
+
+        try:
+            value = loader()
+            with self._lock:
+                # 加载期间相关标签被失效过，结果可能已过期，不写入缓存
+                if value is not None and versions == self._tag_snapshot(tags):
+                    self._set_locked(key, value, tags)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def invalidate(self, *tags):
+        """清除带有任一标签的条目"""
+        with self._lock:
+            for tag in tags:
+                self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+                for key in self._tag_keys.pop(tag, ()):
+                    self._remove_locked(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tag_keys.clear()
+
+    def _tag_snapshot(self, tags):
+        return tuple(self._tag_versions.get(tag, 0) for tag in tags)
+
+    def _get_locked(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._remove_locked(key)
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def _set_locked(self, key, value, tags):
+        self._remove_locked(key)
+        self._data[key] = (time.monotonic() + self.ttl, value, tuple(tags))
+        for tag in tags:
+            self._tag_keys.setdefault(tag, set()).add(key)
+        while len(self._data) > self.maxsize:
+            oldest = next(iter(self._data))
+            self._remove_locked(oldest)
+
+    def _remove_locked(self, key):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+
+
+# 商品目录缓存：商品详情、分类列表、商品列表前几页
+catalog_cache = TTLCache()
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def invalidate_products(product_ids=(), catalog_changed=False):
+    """商品变更后使目录缓存失效
+
+    商品详情按商品 id 精确失效，按是否有货筛选的列表（product_stock）随之失效；
+    catalog_changed 为 True（新增、删除、修改商品信息）时同时失效商品列表和分类列表。
+    仅库存变化时传 False。
+    """
+    tags = [product_tag(product_id) for product_id in product_ids]
+    if tags:
+        tags.append('product_stock')
+    if catalog_changed:
+        tags.extend(['product_list', 'categories'])
+    if tags:
+        catalog_cache.invalidate(*tags)
@@ -0,0 +1,135 @@
+"""购物车写操作
+
+cart_items 上 (user_id, product_id) 唯一，每个操作都是一条语句：
+- 加入购物车：INSERT ... SELECT FROM products ... ON CONFLICT DO UPDATE 累加数量，
+  商品不存在时不写入任何行；并发加入同一商品不会产生重复行
+- 修改数量、删除：一条 UPDATE / DELETE，按影响行数判断购物车项是否存在
+这里的函数不提交事务，由调用方提交。
+
+批量接口把一组 add / set / remove 操作按顺序在同一个事务中执行，客户端可以把
+连续的步进器点击、勾选合并成一次请求。
+"""
+from datetime import datetime
+from sqlalchemy import delete, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models.cart import CartItem
+from app.models.product import Product
+
+
+def _insert():
+    """支持 ON CONFLICT 的 insert（SQLite / PostgreSQL）"""
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(CartItem.__table__)
+
+
+def add_item(user_id, product_id, quantity=1):
+    """加入购物车（已有则累加数量），商品不存在时返回 False"""
+    now = datetime.utcnow()
+    stmt = _insert().from_select(
+        ['user_id', 'product_id', 'quantity', 'created_at', 'updated_at'],
+        select(literal(user_id), Product.id, literal(quantity), literal(now), literal(now))
+        .where(Product.id == product_id)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'product_id'],
+        set_={
+            'quantity': CartItem.__table__.c.quantity + stmt.excluded.quantity,
+            'updated_at': stmt.excluded.updated_at
+        }
+    )
+    return db.session.execute(stmt).rowcount > 0
+
+
+def set_quantity(user_id, product_id, quantity):
+    """修改购物车项数量，购物车项不存在时返回 False"""
+    result = db.session.execute(
+        update(CartItem)
+        .where(CartItem.user_id == user_id, CartItem.product_id == product_id)
+        .values(quantity=quantity, updated_at=datetime.utcnow())
+    )
+    return result.rowcount > 0
+
+
+def remove_item(user_id, product_id):
+    """删除购物车项，购物车项不存在时返回 False"""
+    result = db.session.execute(
+        delete(CartItem).where(CartItem.user_id == user_id, CartItem.product_id == product_id)
+    )
+    return result.rowcount > 0
+
+
+BATCH_OPS = ('add', 'set', 'remove')
+
+
+def parse_ops(ops, max_ops):
+    """校验批量操作，返回 [(op, product_id, quantity)]；格式错误时抛出 ValueError"""
+    if not isinstance(ops, list) or not ops:
+        raise ValueError('缺少操作列表')
+    if len(ops) > max_ops:
+        raise ValueError(f'一次最多 {max_ops} 个操作')
+    parsed = []
+    for index, op in enumerate(ops):
+        if not isinstance(op, dict) or op.get('op') not in BATCH_OPS:
+            raise ValueError(f'第 {index + 1} 个操作类型无效')
+        product_id = op.get('product_id')
+        quantity = op.get('quantity', 1 if op['op'] == 'add' else None)
+        if not isinstance(product_id, int):
+            raise ValueError(f'第 {index + 1} 个操作缺少商品ID')
+        if op['op'] != 'remove' and (not isinstance(quantity, int) or quantity < 1):
+            raise ValueError(f'第 {index + 1} 个操作的数量无效')
+        parsed.append((op['op'], product_id, quantity))
+    return parsed
+
+
+def apply_ops(user_id, ops):
+    """按顺序执行批量操作，返回失败的操作 [{index, product_id, msg}]（其余操作照常执行）"""
+    errors = []
+    for index, (op, product_id, quantity) in enumerate(ops):
+        if op == 'add':
+            ok, msg = add_item(user_id, product_id, quantity), '商品不存在'
+        elif op == 'set':
+            ok, msg = set_quantity(user_id, product_id, quantity), '购物车项不存在'
+        else:
+            ok, msg = remove_item(user_id, product_id), '购物车项不存在'
+        if not ok:
+            errors.append({'index': index, 'product_id': product_id, 'msg': msg})
+    return errors
+
+
+def merge_duplicate_cart_items():
+    """迁移：合并同一用户同一商品的重复购物车项（数量相加，保留最早的一行），之后才能创建唯一索引"""
+    duplicated = db.session.execute(
+        select(CartItem.user_id)
+        .group_by(CartItem.user_id, CartItem.product_id)
+        .having(db.func.count() > 1)
+        .limit(1)
+    ).first()
+    if duplicated is None:
+        return
+    db.session.execute(db.text(
+        'UPDATE cart_items SET quantity = ('
+        'SELECT SUM(quantity) FROM cart_items AS dup '
+        'WHERE dup.user_id = cart_items.user_id AND dup.product_id = cart_items.product_id) '
+        'WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id HAVING COUNT(*) > 1)'
+    ))
+    result = db.session.execute(db.text(
+        'DELETE FROM cart_items WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY user_id, product_id)'
+    ))
+    print(f"已合并重复的购物车项 {result.rowcount} 条")
+
+
+def ensure_autoincrement_id():
+    """迁移：cart_items 的主键使用 AUTOINCREMENT
+
+    没有 AUTOINCREMENT 时 SQLite 按当前最大 id + 1 分配新 id，最大 id 的行被删除后新行会复用它，
+    memory 后端中删除前取出、尚未写回的数量修改可能写到复用该 id 的新行上。
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    from app.utils.schema import rebuild_sqlite_table
+    sql = db.session.execute(
+        db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'cart_items'")
+    ).scalar()
+    if 'AUTOINCREMENT' not in (sql or '').upper():
+        rebuild_sqlite_table(CartItem.__table__)
@@ -0,0 +1,318 @@
+"""购物车存储后端
+
+CART_BACKEND = 'database'（默认）：每个操作直接写 cart_items 并提交。
+
+CART_BACKEND = 'memory'：写回（write-behind）模式，减少购物车操作对 SQLite 写锁的占用：
+- 用户的购物车在首次操作时从 cart_items 读入进程内存，加购已有商品、修改数量只修改内存
+  并记为待写回，同一商品的连续修改合并为一次写入
+- 加入购物车中还没有的商品、删除购物车项时立即写入数据库（结算按数据库分配的购物车项 id
+  进行，删除后也不会被之后的写回覆盖）
+- 后台线程每 CART_FLUSH_INTERVAL 秒把待写回的修改在一个事务中批量写入；待写回的修改
+  超过 CART_MAX_DIRTY 条时在当前请求中立即写回；结算前和进程正常退出时也会写回
+- cart_items 仍然是唯一的持久化来源，进程重启后从数据库重新读取
+
+持久性边界：进程异常退出时最多丢失 CART_FLUSH_INTERVAL 秒内、不超过 CART_MAX_DIRTY 条的修改。
+限制：内存中的购物车只属于当前进程。gunicorn 启动多个 worker 时，同一用户的请求可能落在
+不同进程上，看到的购物车不一致，因此 memory 后端只适用于单 worker 部署（默认的 Procfile
+即为单 worker）；多 worker 部署请使用 database 后端。
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, select, update
+from app import db
+from app.models.cart import CartItem
+from app.utils import cart
+from app.utils.serializers import load_cart, cart_item_status
+
+BACKENDS = ('database', 'memory')
+
+
+class DatabaseCartStore:
+    """默认后端：每个操作直接写入 cart_items"""
+
+    def add_item(self, user_id, product_id, quantity):
+        if not cart.add_item(user_id, product_id, quantity):
+            return False
+        db.session.commit()
+        return True
+
+    def set_quantity(self, user_id, product_id, quantity):
+        if not cart.set_quantity(user_id, product_id, quantity):
+            return False
+        db.session.commit()
+        return True
+
+    def remove_item(self, user_id, product_id):
+        if not cart.remove_item(user_id, product_id):
+            return False
+        db.session.commit()
+        return True
+
+    def apply_ops(self, user_id, ops):
+        errors = cart.apply_ops(user_id, ops)
+        db.session.commit()
+        return errors
+
+    def list_items(self, user_id):
+        return load_cart(user_id)
+
+    def flush(self, user_id=None):
+        pass
+
+
+class MemoryCartStore:
+    """进程内购物车，数量修改定时批量写回 cart_items
+
+    锁：同一用户的操作由该用户的分段锁串行化，数据库读写只在分段锁内进行；
+    全局锁 _lock 只保护内存中的字典，持有时不访问数据库。加锁顺序为分段锁 -> _lock。
+    """
+
+    LOCK_STRIPES = 64
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._user_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        # user_id -> {product_id: [cart_item_id, quantity]}，只保留有待写回修改的购物车
+        self._carts = {}
+        # user_id -> {product_id}，数量待写回的购物车项
+        self._dirty = {}
+        self._dirty_count = 0
+        self._app = None
+        self._interval = 2
+        self._max_dirty = 1000
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self._app = app
+        self._interval = app.config['CART_FLUSH_INTERVAL']
+        self._max_dirty = app.config['CART_MAX_DIRTY']
+        atexit.register(self._flush_at_exit)
+
+    def _ensure_thread(self):
+        # fork 出的子进程中没有父进程的线程，需要重新启动
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='cart-flush', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception as e:
+                print(f"购物车写回失败: {str(e)}")
+
+    def _flush_at_exit(self):
+        if self._dirty:
+            with self._app.app_context():
+                self.flush()
+
+    def _user_lock(self, user_id):
+        return self._user_locks[hash(user_id) % self.LOCK_STRIPES]
+
+    def _cart(self, user_id):
+        """调用方持有该用户的分段锁；用户的购物车不在内存中时从数据库读取"""
+        with self._lock:
+            items = self._carts.get(user_id)
+        if items is None:
+            rows = db.session.execute(
+                select(CartItem.id, CartItem.product_id, CartItem.quantity)
+                .where(CartItem.user_id == user_id)
+            ).all()
+            with self._lock:
+                items = self._carts.setdefault(
+                    user_id, {row.product_id: [row.id, row.quantity] for row in rows}
+                )
+        return items
+
+    def _mark_dirty(self, user_id, product_id):
+        """调用方持有 self._lock"""
+        dirty = self._dirty.setdefault(user_id, set())
+        if product_id not in dirty:
+            dirty.add(product_id)
+            self._dirty_count += 1
+
+    def _clear_dirty(self, user_id, product_id):
+        """调用方持有 self._lock"""
+        dirty = self._dirty.get(user_id)
+        if dirty and product_id in dirty:
+            dirty.discard(product_id)
+            self._dirty_count -= 1
+            if not dirty:
+                del self._dirty[user_id]
+
+    def _add(self, user_id, product_id, quantity):
+        items = self._cart(user_id)
+        with self._lock:
+            entry = items.get(product_id)
+            if entry is not None:
+                entry[1] += quantity
+                self._mark_dirty(user_id, product_id)
+                return True
+        # 购物车中还没有的商品直接写入数据库（不提交），取得购物车项 id
+        if not cart.add_item(user_id, product_id, quantity):
+            return False
+        row = db.session.execute(
+            select(CartItem.id, CartItem.quantity)
+            .where(CartItem.user_id == user_id, CartItem.product_id == product_id)
+        ).one()
+        with self._lock:
+            items[product_id] = [row.id, row.quantity]
+        return True
+
+    def _set(self, user_id, product_id, quantity):
+        items = self._cart(user_id)
+        with self._lock:
+            entry = items.get(product_id)
+            if entry is None:
+                return False
+            entry[1] = quantity
+            self._mark_dirty(user_id, product_id)
+        return True
+
+    def _remove(self, user_id, product_id):
+        # 删除直接写入数据库（不提交），之后写回的数量修改按 id、user_id、product_id 更新，不会再写入已删除的行
+        items = self._cart(user_id)
+        with self._lock:
+            entry = items.get(product_id)
+        if entry is None:
+            return False
+        db.session.execute(delete(CartItem).where(CartItem.id == entry[0]))
+        with self._lock:
+            items.pop(product_id, None)
+            self._clear_dirty(user_id, product_id)
+        return True
+
+    def _apply(self, user_id, ops):
+        """调用方持有该用户的分段锁；执行操作并提交，失败时恢复该用户在内存中的购物车"""
+        items = self._cart(user_id)
+        with self._lock:
+            saved = {product_id: list(entry) for product_id, entry in items.items()}
+            dirty = set(self._dirty.get(user_id, ()))
+        errors = []
+        try:
+            for index, (op, product_id, quantity) in enumerate(ops):
+                if op == 'add':
+                    ok, msg = self._add(user_id, product_id, quantity), '商品不存在'
+                elif op == 'set':
+                    ok, msg = self._set(user_id, product_id, quantity), '购物车项不存在'
+                else:
+                    ok, msg = self._remove(user_id, product_id), '购物车项不存在'
+                if not ok:
+                    errors.append({'index': index, 'product_id': product_id, 'msg': msg})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self._carts[user_id] = saved
+                self._dirty_count += len(dirty) - len(self._dirty.get(user_id, ()))
+                if dirty:
+                    self._dirty[user_id] = dirty
+                else:
+                    self._dirty.pop(user_id, None)
+            raise
+        return errors
+
+    def _evict_if_clean(self, user_id):
+        """调用方持有该用户的分段锁；没有待写回修改的购物车从内存中移除，下次操作时重新读取"""
+        with self._lock:
+            if user_id not in self._dirty:
+                self._carts.pop(user_id, None)
+
+    def _write(self, user_id, ops):
+        with self._user_lock(user_id):
+            try:
+                errors = self._apply(user_id, ops)
+            finally:
+                self._evict_if_clean(user_id)
+        self._ensure_thread()
+        # 在分段锁外写回，flush 需要获取各用户的分段锁
+        if self._dirty_count >= self._max_dirty:
+            self.flush()
+        return errors
+
+    def add_item(self, user_id, product_id, quantity):
+        return not self._write(user_id, [('add', product_id, quantity)])
+
+    def set_quantity(self, user_id, product_id, quantity):
+        return not self._write(user_id, [('set', product_id, quantity)])
+
+    def remove_item(self, user_id, product_id):
+        return not self._write(user_id, [('remove', product_id, None)])
+
+    def apply_ops(self, user_id, ops):
+        """与 cart.apply_ops 相同：按顺序执行，返回失败的操作；新增和删除在一个事务中写入"""
+        return self._write(user_id, ops)
+
+    def list_items(self, user_id):
+        """从数据库读取购物车和商品信息，数量以内存中尚未写回的修改为准"""
+        items = load_cart(user_id)
+        with self._lock:
+            quantities = {product_id: entry[1] for product_id, entry in self._carts.get(user_id, {}).items()}
+        for item in items:
+            quantity = quantities.get(item['product_id'], item['quantity'])
+            if quantity != item['quantity']:
+                status = cart_item_status(item['status'] != 'deleted', item['stock'], quantity)
+                item.update(quantity=quantity, status=status, available=status == 'normal')
+        return items
+
+    def flush(self, user_id=None):
+        """把待写回的数量修改（user_id 不为空时只写回该用户的）在一个事务中写入 cart_items
+
+        写回后没有新修改的购物车从内存中移除，下次操作时重新读取。
+        """
+        with self._flush_lock:
+            with self._lock:
+                user_ids = [user_id] if user_id is not None else list(self._dirty)
+                changes = []
+                for uid in user_ids:
+                    for product_id in self._dirty.pop(uid, ()):
+                        item_id, quantity = self._carts[uid][product_id]
+                        changes.append((uid, product_id, item_id, quantity))
+                self._dirty_count -= len(changes)
+
+            if changes:
+                table = CartItem.__table__
+                try:
+                    # 取出修改后该行可能已被删除；同时匹配 user_id、product_id，不会写到其他购物车项上
+                    db.session.execute(
+                        update(table).where(table.c.id == db.bindparam('item_id'),
+                                            table.c.user_id == db.bindparam('uid'),
+                                            table.c.product_id == db.bindparam('pid'))
+                        .values(quantity=db.bindparam('quantity'), updated_at=datetime.utcnow()),
+                        [{'item_id': item_id, 'uid': uid, 'pid': product_id, 'quantity': quantity}
+                         for uid, product_id, item_id, quantity in changes]
+                    )
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    with self._lock:
+                        for uid, product_id, _, _ in changes:
+                            if product_id in self._carts.get(uid, {}):
+                                self._mark_dirty(uid, product_id)
+                    raise
+
+            # 正在执行操作的用户持有分段锁，等其完成后再判断是否可以移除
+            for uid in user_ids:
+                with self._user_lock(uid):
+                    self._evict_if_clean(uid)
+
+
+database_cart_store = DatabaseCartStore()
+memory_cart_store = MemoryCartStore()
+
+
+def get_cart_store():
+    """按 CART_BACKEND 配置返回购物车存储后端"""
+    if current_app.config['CART_BACKEND'] == 'memory':
+        return memory_cart_store
+    return database_cart_store
@@ -0,0 +1,133 @@
+"""商品分类维护
+
+商品的 category（名称）与 category_id 同步写入，categories.product_count
+在商品新增、修改分类、删除时用 UPDATE ... SET product_count = product_count ± 1 增量维护，
+分类列表接口因此只需读取 categories 表。
+categories 表每次变更都在同一事务中递增 app_meta 中的 catalog_version，作为分类列表的 ETag 版本。
+"""
+from sqlalchemy import text, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.product import Category
+from app.utils import meta
+
+# 图片映射，确保使用服务器上真实存在的图片
+CATEGORY_IMAGE_MAP = {
+    'table': '/static/images/category/category_table.png',
+    'chair': '/static/images/category/category_chair.png',
+    'bed': '/static/images/category/category_bed.png'
+}
+DEFAULT_CATEGORY_IMAGE = '/static/images/category/category_default.png'
+
+
+def default_category_image(name):
+    return CATEGORY_IMAGE_MAP.get(name.lower(), DEFAULT_CATEGORY_IMAGE)
+
+
+def get_or_create_category(name):
+    """按名称获取分类，不存在时创建"""
+    category = Category.query.filter_by(name=name).first()
+    if category:
+        return category
+    try:
+        # 使用保存点，并发创建同名分类时回退到查询
+        with db.session.begin_nested():
+            category = Category(name=name, image=default_category_image(name), product_count=0)
+            db.session.add(category)
+        return category
+    except IntegrityError:
+        return Category.query.filter_by(name=name).first()
+
+
+def get_or_create_category_ids(names):
+    """批量获取分类 id，不存在的分类一并创建，返回 {名称: id}"""
+    names = {name for name in names if name}
+    if not names:
+        return {}
+    ids = dict(db.session.query(Category.name, Category.id).filter(Category.name.in_(names)).all())
+    for name in names - ids.keys():
+        ids[name] = get_or_create_category(name).id
+    return ids
+
+
+def adjust_category_counts(deltas):
+    """按 {分类 id: 增量} 批量调整分类商品数"""
+    for category_id, delta in deltas.items():
+        if category_id and delta:
+            _adjust_count(category_id, delta)
+
+
+def resolve_category_id(value):
+    """把请求中的分类参数（分类 id 或名称）解析为分类 id，找不到时返回 None"""
+    if value is None or value == '':
+        return None
+    if str(value).isdigit():
+        return int(value)
+    return db.session.query(Category.id).filter_by(name=value).scalar()
+
+
+def _adjust_count(category_id, delta):
+    db.session.execute(
+        update(Category)
+        .where(Category.id == category_id)
+        .values(product_count=Category.product_count + delta)
+    )
+    meta.increment(meta.CATALOG_VERSION)
+
+
+def set_product_category(product, name):
+    """修改商品分类并增量维护分类商品数，name 为空表示清除分类"""
+    category = get_or_create_category(name) if name else None
+    new_id = category.id if category else None
+    if product.category_id != new_id:
+        if product.category_id:
+            _adjust_count(product.category_id, -1)
+        if new_id:
+            _adjust_count(new_id, 1)
+    product.category_id = new_id
+    product.category = category.name if category else None
+
+
+def release_product_category(product):
+    """删除商品前调用，扣减所属分类的商品数"""
+    if product.category_id:
+        _adjust_count(product.category_id, -1)
+
+
+def fill_categories():
+    """为商品的分类名称建立分类记录、回填 category_id 并校正商品数，不提交事务
+
+    只在有行被插入或修改时递增 catalog_version。写商品的接口已同步维护分类，
+    只有绕过接口直接插入的商品（测试数据、脚本）需要调用。
+    """
+    names = db.session.execute(text(
+        'SELECT DISTINCT category FROM products '
+        'WHERE category IS NOT NULL AND category != \'\' '
+        'AND category NOT IN (SELECT name FROM categories)'
+    )).scalars().all()
+    for name in names:
+        db.session.add(Category(name=name, image=default_category_image(name), product_count=0))
+    db.session.flush()
+
+    changed = len(names)
+    changed += db.session.execute(text(
+        'UPDATE products SET category_id = '
+        '(SELECT id FROM categories WHERE categories.name = products.category) '
+        'WHERE category_id IS NULL AND category IS NOT NULL'
+    )).rowcount
+    changed += db.session.execute(text(
+        'UPDATE categories SET product_count = '
+        '(SELECT count(*) FROM products WHERE products.category_id = categories.id) '
+        'WHERE product_count != '
+        '(SELECT count(*) FROM products WHERE products.category_id = categories.id)'
+    )).rowcount
+    if changed:
+        meta.increment(meta.CATALOG_VERSION)
+
+
+def backfill_categories():
+    """迁移：categories 表加入前的商品回填一次，完成后记入 app_meta，之后启动时不再扫描商品表"""
+    if meta.get_value(meta.CATEGORIES_BACKFILLED):
+        return
+    fill_categories()
+    meta.set_value(meta.CATEGORIES_BACKFILLED, 1)
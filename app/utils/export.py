@@ -0,0 +1,171 @@
+"""订单、用户数据导出（CSV / JSON Lines）
+
+导出内容以生成器逐块产出，配合 stream_with_context 边查询边发送：
+- 主查询只选择导出所需的列，按主键分块读取，内存占用与数据量无关；每块在各自的短事务中读取，
+  发送数据时不持有数据库读事务，导出期间不会阻塞写操作
+- 每块订单的订单项、收货地址各用一次 IN 查询加载
+- 先导出 orders 中的订单，再导出归档订单
+CSV 每个订单项一行（订单字段重复），没有订单项的订单占一行；JSON Lines 每个订单一行。
+"""
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from app import db
+from app.models.order import Order, OrderArchive, OrderItem, OrderItemArchive
+from app.models.user import User
+from app.utils.serializers import load_order_items, load_addresses, format_time
+
+FORMATS = ('csv', 'jsonl')
+
+CHUNK_SIZE = 1000
+
+MIMETYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8'
+}
+
+ORDER_FIELDS = [
+    'order_id', 'order_number', 'status', 'total_amount', 'created_at', 'updated_at',
+    'user_id', 'username', 'email', 'receiver', 'phone', 'address', 'archived'
+]
+ITEM_FIELDS = ['product_id', 'product_name', 'quantity', 'price', 'subtotal']
+USER_FIELDS = ['id', 'username', 'email', 'phone', 'balance', 'created_at']
+
+
+def parse_date_range(start_date, end_date):
+    """解析 YYYY-MM-DD 格式的起止日期（均包含当天），格式错误时抛出 ValueError"""
+    start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+    end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1) if end_date else None
+    return start, end
+
+
+def _filter_created(query, model, start, end):
+    if start:
+        query = query.filter(model.created_at >= start)
+    if end:
+        query = query.filter(model.created_at < end)
+    return query
+
+
+def _csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def _jsonl_line(data):
+    return json.dumps(data, ensure_ascii=False) + '\n'
+
+
+def _stream_chunks(query, id_column):
+    """按主键分块读取（id > 上一块最后的 id，LIMIT CHUNK_SIZE），每次产出一块 Row
+
+    query 须按 id_column 升序排列。每块在各自的短事务中读取，调用方在发送数据前调用
+    _end_read 结束读事务：SQLite 为回滚日志模式，流式响应发送期间一直持有读事务会阻塞所有写操作。
+    """
+    last_id = None
+    while True:
+        chunk_query = query if last_id is None else query.filter(id_column > last_id)
+        chunk = chunk_query.limit(CHUNK_SIZE).all()
+        if not chunk:
+            _end_read()
+            return
+        last_id = chunk[-1].id
+        yield chunk
+        if len(chunk) < CHUNK_SIZE:
+            return
+
+
+def _end_read():
+    """结束当前读事务，释放数据库连接"""
+    db.session.rollback()
+
+
+def _order_rows(model, status, start, end):
+    query = db.session.query(
+        model.id, model.order_number, model.status, model.total_amount,
+        model.created_at, model.updated_at, model.address_id, model.user_id,
+        User.username, User.email
+    ).outerjoin(User, User.id == model.user_id)
+    if status:
+        query = query.filter(model.status == status)
+    return _filter_created(query, model, start, end).order_by(model.id)
+
+
+def _order_record(row, address, archived):
+    return {
+        'order_id': row.id,
+        'order_number': row.order_number,
+        'status': row.status,
+        'total_amount': row.total_amount,
+        'created_at': format_time(row.created_at),
+        'updated_at': format_time(row.updated_at),
+        'user_id': row.user_id,
+        'username': row.username,
+        'email': row.email,
+        'receiver': address['name'] if address else '',
+        'phone': address['phone'] if address else '',
+        'address': ''.join(
+            address[key] or '' for key in ('province', 'city', 'district', 'detail')
+        ) if address else '',
+        'archived': archived
+    }
+
+
+def _item_record(item):
+    return {
+        'product_id': item.product_id,
+        'product_name': item.product_name,
+        'quantity': item.quantity,
+        'price': item.price,
+        'subtotal': round(item.price * item.quantity, 2)
+    }
+
+
+def export_orders(fmt, status=None, start=None, end=None):
+    """逐块产出订单导出内容（含订单项）"""
+    if fmt == 'csv':
+        yield '\ufeff'  # BOM，Excel 打开时按 UTF-8 识别中文
+        yield _csv_line(ORDER_FIELDS + ITEM_FIELDS)
+
+    for model, item_model, archived in ((Order, OrderItem, False), (OrderArchive, OrderItemArchive, True)):
+        for chunk in _stream_chunks(_order_rows(model, status, start, end), model.id):
+            items = load_order_items([row.id for row in chunk], item_model)
+            addresses = load_addresses([row.address_id for row in chunk])
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in chunk:
+                order = _order_record(row, addresses.get(row.address_id), archived)
+                order_items = [_item_record(item) for item in items.get(row.id, [])]
+                if fmt == 'jsonl':
+                    buffer.write(_jsonl_line({**order, 'items': order_items}))
+                    continue
+                order_values = [order[key] for key in ORDER_FIELDS]
+                for item in order_items or [dict.fromkeys(ITEM_FIELDS, '')]:
+                    writer.writerow(order_values + [item[key] for key in ITEM_FIELDS])
+            _end_read()
+            yield buffer.getvalue()
+
+
+def export_users(fmt, start=None, end=None):
+    """逐块产出用户导出内容"""
+    if fmt == 'csv':
+        yield '\ufeff'
+        yield _csv_line(USER_FIELDS)
+
+    query = db.session.query(
+        User.id, User.username, User.email, User.phone, User.balance, User.created_at
+    )
+    query = _filter_created(query, User, start, end).order_by(User.id)
+    for chunk in _stream_chunks(query, User.id):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in chunk:
+            record = {**row._asdict(), 'created_at': format_time(row.created_at)}
+            if fmt == 'jsonl':
+                buffer.write(_jsonl_line(record))
+            else:
+                writer.writerow([record[key] for key in USER_FIELDS])
+        _end_read()
+        yield buffer.getvalue()
@@ -0,0 +1,65 @@
+"""HTTP 条件请求（ETag / If-None-Match）
+
+conditional_get 装饰器为 GET 接口加上强 ETag 和 Cache-Control：
+- 提供 version 函数时，用内容版本（如商品 updated_at）计算 ETag，
+  命中 If-None-Match 直接返回 304，不执行视图也不序列化 JSON
+- 未提供 version 时，对响应体做哈希得到 ETag，仍可节省带宽
+只处理 200 响应，错误响应原样返回。
+
+ETag 来自数据库中的版本，响应体却可能来自进程内缓存（其他 worker 的修改不会使本进程的缓存失效）。
+视图用 content_version() 取得本次请求计算出的版本并作为缓存 key 的一部分，
+版本变化后不会再用旧的缓存条目配新的 ETag。
+"""
+import hashlib
+from functools import wraps
+from flask import request, make_response, current_app, g
+
+
+def _etag_for(*parts):
+    raw = '|'.join(str(part) for part in parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def content_version():
+    """conditional_get 为当前请求计算出的内容版本，没有时返回 None"""
+    return g.get('content_version')
+
+
+def _apply_cache_control(response, max_age):
+    if max_age > 0:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        # 允许缓存，但每次使用前都要用 ETag 重新验证
+        response.cache_control.no_cache = True
+
+
+def conditional_get(version=None, max_age=0):
+    """version: 接收视图参数，返回内容版本；返回 None 时按响应体哈希处理
+    max_age: 客户端可直接使用缓存的秒数，0 表示每次都要重新验证
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = None
+            if version is not None:
+                content_version = g.content_version = version(*args, **kwargs)
+                if content_version is not None:
+                    etag = _etag_for(request.full_path, content_version)
+                    if request.if_none_match.contains(etag):
+                        response = current_app.response_class(status=304)
+                        response.set_etag(etag)
+                        _apply_cache_control(response, max_age)
+                        return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+            if etag is None:
+                etag = hashlib.sha1(response.get_data()).hexdigest()
+            response.set_etag(etag)
+            _apply_cache_control(response, max_age)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
@@ -0,0 +1,181 @@
+"""幂等键（Idempotency-Key 请求头）
+
+客户端超时重试下单、支付、充值时带上同一个 Idempotency-Key，服务端只执行一次：
+- 首个请求先写入一条 in_progress 记录（唯一约束保证只有一个请求能写入），
+  执行完成后保存响应；5xx 响应删除记录，允许客户端重试
+- 重复请求直接返回保存的响应，不再执行视图
+- 首个请求还在执行时到达的重复请求轮询等待其完成，而不是重复执行
+- in_progress 记录带有租约：执行者崩溃后记录不会完成，超过 IDEMPOTENCY_LEASE 秒后
+  相同请求的重试用条件 UPDATE 接手执行；原执行者之后的写入按 claimed_at 判断，不会覆盖
+已完成的响应同时放在进程内缓存中，同一进程内的重试不用查询数据库。
+记录在 IDEMPOTENCY_KEY_TTL 秒后过期。
+"""
+import hashlib
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, current_app, make_response
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.idempotency import IdempotencyKey
+from app.utils.cache import TTLCache
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 100
+
+# 等待首个请求完成时的轮询间隔（秒）
+POLL_INTERVAL = 0.05
+
+# 过期记录的清理间隔（秒）
+PURGE_INTERVAL = 60
+
+# 已完成请求的响应：(scope, endpoint, key) -> (request_hash, status_code, body)
+completed_responses = TTLCache(maxsize=1024, ttl=600)
+
+_last_purge = 0.0
+
+
+def _scope():
+    """请求方标识：Authorization 中的用户 ID"""
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.split(' ')[-1]
+    return token.split(':')[0][:64]
+
+
+def _replay(request_hash, stored):
+    stored_hash, status_code, body = stored
+    if stored_hash != request_hash:
+        return jsonify({'code': 422, 'msg': '该幂等键已用于其他请求'}), 422
+    response = current_app.response_class(body, status=status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _purge_expired(now):
+    global _last_purge
+    if time.monotonic() - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = time.monotonic()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+    db.session.commit()
+
+
+def _lease_cutoff(now):
+    return now - timedelta(seconds=current_app.config['IDEMPOTENCY_LEASE'])
+
+
+def _claim(scope, endpoint, key, request_hash):
+    """写入 in_progress 记录或接手租约已过期的记录，成功返回 claimed_at；否则返回 None"""
+    now = datetime.utcnow()
+    _purge_expired(now)
+    try:
+        db.session.execute(insert(IdempotencyKey).values(
+            key=key, scope=scope, endpoint=endpoint, request_hash=request_hash,
+            status='in_progress', created_at=now, claimed_at=now,
+            expires_at=now + timedelta(seconds=current_app.config['IDEMPOTENCY_KEY_TTL'])
+        ))
+        db.session.commit()
+        return now
+    except IntegrityError:
+        db.session.rollback()
+    record = (IdempotencyKey.scope == scope, IdempotencyKey.endpoint == endpoint, IdempotencyKey.key == key)
+    # 已过期的记录视为不存在，删除后重新写入
+    expired = db.session.execute(delete(IdempotencyKey).where(*record, IdempotencyKey.expires_at < now))
+    db.session.commit()
+    if expired.rowcount:
+        return _claim(scope, endpoint, key, request_hash)
+    # 相同请求的 in_progress 记录租约已过期，执行者可能已崩溃，接手执行；条件 UPDATE 保证只有一个请求接手
+    taken = db.session.execute(update(IdempotencyKey).where(
+        *record, IdempotencyKey.status == 'in_progress', IdempotencyKey.request_hash == request_hash,
+        db.func.coalesce(IdempotencyKey.claimed_at, IdempotencyKey.created_at) < _lease_cutoff(now)
+    ).values(claimed_at=now))
+    db.session.commit()
+    return now if taken.rowcount else None
+
+
+def _load(scope, endpoint, key):
+    row = db.session.execute(select(
+        IdempotencyKey.request_hash, IdempotencyKey.status,
+        IdempotencyKey.status_code, IdempotencyKey.response_body,
+        db.func.coalesce(IdempotencyKey.claimed_at, IdempotencyKey.created_at).label('claimed_at')
+    ).where(
+        IdempotencyKey.scope == scope, IdempotencyKey.endpoint == endpoint, IdempotencyKey.key == key
+    )).first()
+    # 结束读事务，下次轮询能看到其他请求提交的结果
+    db.session.rollback()
+    return row
+
+
+def _wait_for(cache_key, scope, endpoint, key, request_hash):
+    """等待执行中的首个请求完成，返回保存的响应；记录被删除或（相同请求的）租约过期时返回 None，超时返回 False"""
+    deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT_TIMEOUT']
+    while time.monotonic() < deadline:
+        stored = completed_responses.get(cache_key)
+        if stored:
+            return stored
+        row = _load(scope, endpoint, key)
+        if row is None:
+            return None
+        if row.status == 'completed':
+            return row.request_hash, row.status_code, row.response_body
+        if row.request_hash == request_hash and row.claimed_at < _lease_cutoff(datetime.utcnow()):
+            return None
+        time.sleep(POLL_INTERVAL)
+    return False
+
+
+def idempotent(view):
+    """为写接口加上 Idempotency-Key 支持，未带请求头时照常执行"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'code': 400, 'msg': f'{HEADER} 长度不能超过 {MAX_KEY_LENGTH}'}), 400
+
+        scope, endpoint = _scope(), request.endpoint
+        cache_key = (scope, endpoint, key)
+        request_hash = hashlib.sha1(request.get_data()).hexdigest()
+
+        while True:
+            stored = completed_responses.get(cache_key)
+            if stored:
+                return _replay(request_hash, stored)
+            claimed_at = _claim(scope, endpoint, key, request_hash)
+            if claimed_at:
+                break
+            stored = _wait_for(cache_key, scope, endpoint, key, request_hash)
+            if stored is False:
+                return jsonify({'code': 409, 'msg': '相同请求正在处理中，请稍后重试'}), 409
+            if stored:
+                completed_responses.set(cache_key, stored)
+                return _replay(request_hash, stored)
+            # 首个请求失败并删除了记录，或租约已过期，由当前请求重新尝试
+
+        # 只写入自己持有的记录：租约过期被其他请求接手后，claimed_at 已改变
+        record = (IdempotencyKey.scope == scope, IdempotencyKey.endpoint == endpoint,
+                  IdempotencyKey.key == key, IdempotencyKey.claimed_at == claimed_at)
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            db.session.execute(delete(IdempotencyKey).where(*record))
+            db.session.commit()
+            raise
+
+        if response.status_code >= 500:
+            db.session.rollback()
+            db.session.execute(delete(IdempotencyKey).where(*record))
+            db.session.commit()
+            return response
+
+        body = response.get_data(as_text=True)
+        db.session.execute(update(IdempotencyKey).where(*record).values(
+            status='completed', status_code=response.status_code, response_body=body
+        ))
+        db.session.commit()
+        completed_responses.set(cache_key, (request_hash, response.status_code, body))
+        return response
+    return wrapper
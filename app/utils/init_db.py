@@ -2,6 +2,10 @@ from app import create_app, db
 from app.models.user import User, Address
 from app.models.product import Product, ProductImage
 from app.models.order import Order, OrderItem
+from app.utils.schema import upgrade_schema
+from app.utils.search import rebuild_search_index
+from app.utils.order_service import fill_item_snapshots
+from app.utils.categories import fill_categories
 import random
 import datetime
 
@@ -21,6 +25,10 @@ def init_db():
         
         # 创建测试订单
         create_test_orders()
+
+        # 补齐索引并重建商品全文索引（drop_all 不会删除 FTS 虚拟表）
+        upgrade_schema()
+        rebuild_search_index()
         
         print("数据库初始化完成，测试数据已创建")
 
@@ -176,6 +184,8 @@ def create_test_products():
             )
             db.session.add(image)
     
+    # 建立分类记录并回填 category_id
+    fill_categories()
     db.session.commit()
 
 def create_test_orders():
@@ -260,6 +270,9 @@ def create_test_orders():
     )
     
     db.session.add_all([order3, order3_item1, order3_item2])
+    db.session.flush()
+    # 写入订单项的商品快照
+    fill_item_snapshots()
     db.session.commit()
 
 if __name__ == '__main__':
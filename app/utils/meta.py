@@ -0,0 +1,39 @@
+"""app_meta 表中的计数器和标记
+
+计数器在调用方的事务中自增，随数据变更一起提交；多个 worker 读到的是同一个值，
+可以作为跨进程一致的内容版本（如分类列表的 ETag）。
+标记记录只需执行一次的数据迁移是否已完成。
+"""
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models.meta import AppMeta
+
+CATALOG_VERSION = 'catalog_version'
+ITEM_SNAPSHOTS_BACKFILLED = 'item_snapshots_backfilled'
+CATEGORIES_BACKFILLED = 'categories_backfilled'
+
+
+def _insert():
+    """支持 ON CONFLICT 的 insert（SQLite / PostgreSQL）"""
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(AppMeta.__table__)
+
+
+def get_value(key, default=0):
+    value = db.session.execute(select(AppMeta.value).where(AppMeta.key == key)).scalar()
+    return default if value is None else value
+
+
+def set_value(key, value):
+    """写入值（不存在时创建），不提交事务"""
+    stmt = _insert().values(key=key, value=value)
+    db.session.execute(stmt.on_conflict_do_update(index_elements=['key'], set_={'value': value}))
+
+
+def increment(key):
+    """计数器加一（不存在时创建），不提交事务"""
+    stmt = _insert().values(key=key, value=1)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['key'], set_={'value': AppMeta.__table__.c.value + 1}
+    ))
@@ -0,0 +1,85 @@
+"""订单号生成
+
+订单号为 29 位数字：UTC 毫秒时间戳（17 位，YYYYMMDDHHMMSSmmm）+ 节点号（2 位）+ 进程号（7 位）+ 序号（3 位）
+- 按时间递增，新订单插入唯一索引的末尾；按日期等前缀查询可以走索引范围扫描
+- 节点号取环境变量 ORDER_NUMBER_NODE_ID（0-99，默认 0），多台服务器部署时每台设置不同的值；
+  同一台服务器上的 gunicorn worker 由进程号区分
+- 同一毫秒内序号递增，用完 1000 个后借用下一毫秒，时钟回拨时沿用上次的时间，同一进程内不会重复；
+  使用 UTC，夏令时切换时本地时间的重复不会影响订单号
+- 模块导入时初始化，fork 出的子进程在 register_at_fork 回调中重新读取进程号并重置序号
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+NODE_ID_ENV = 'ORDER_NUMBER_NODE_ID'
+
+SEQUENCE_SIZE = 1000
+
+_lock = threading.Lock()
+_worker = ''
+_last_ms = 0
+_sequence = 0
+_second = None
+_second_str = ''
+
+
+def _reset():
+    """（重新）初始化当前进程的状态，模块导入时和 fork 后调用"""
+    global _lock, _worker, _last_ms, _sequence, _second, _second_str
+    node_id = int(os.environ.get(NODE_ID_ENV) or 0)
+    if not 0 <= node_id < 100:
+        raise ValueError(f'{NODE_ID_ENV} 必须在 0-99 之间')
+    # fork 时父进程中的其他线程可能正持有锁，子进程中换一把新锁
+    _lock = threading.Lock()
+    _worker = f'{node_id:02d}{os.getpid() % 10 ** 7:07d}'
+    _last_ms = 0
+    _sequence = 0
+    _second = None
+    _second_str = ''
+
+
+_reset()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def generate_order_number():
+    """生成一个新的订单号"""
+    global _last_ms, _sequence, _second, _second_str
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms, _sequence = now_ms, 0
+        else:
+            _sequence += 1
+            if _sequence >= SEQUENCE_SIZE:
+                _last_ms, _sequence = _last_ms + 1, 0
+        ms, sequence = _last_ms, _sequence
+
+        second = ms // 1000
+        if second != _second:
+            _second, _second_str = second, datetime.fromtimestamp(second, timezone.utc).strftime('%Y%m%d%H%M%S')
+        return f'{_second_str}{ms % 1000:03d}{_worker}{sequence:03d}'
+
+
+def _generate_many(count):
+    return [generate_order_number() for _ in range(count)]
+
+
+def benchmark(count, processes=1):
+    """在 processes 个进程中共生成 count 个订单号，返回 (生成数量, 重复数量, 耗时秒, 是否有序)"""
+    per_process = max(count // processes, 1)
+    start = time.perf_counter()
+    if processes > 1:
+        import multiprocessing
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            batches = pool.map(_generate_many, [per_process] * processes)
+    else:
+        batches = [_generate_many(per_process)]
+    elapsed = time.perf_counter() - start
+
+    numbers = [number for batch in batches for number in batch]
+    ordered = all(batch == sorted(batch) for batch in batches)
+    return len(numbers), len(numbers) - len(set(numbers)), elapsed, ordered
@@ -0,0 +1,325 @@
+"""下单服务
+
+后台创建订单、小程序下单和购物车结算（checkout_cart）共用同一套下单逻辑：
+- 同一商品的多行合并数量，所有商品用一次 IN 查询加载
+- 库存用条件更新 UPDATE ... SET stock = stock - :q WHERE id = :id AND stock >= :q 扣减，
+  受影响行数为 0 说明已被其他订单抢先买走，整个订单回滚，不会超卖
+- 订单和订单项在同一个事务中写入，订单项批量插入
+- 订单项保存下单时的商品名称、主图和分类快照，读取订单时不再查询商品表
+- 小程序订单详情保存为 orders.detail_snapshot，下单和每次状态变更时在同一事务中重新生成，
+  详情接口只需按主键读取一行
+
+订单状态变更（单个和批量）共用 check_transition 校验规则；取消订单时按商品汇总数量，
+每个商品一条 UPDATE 恢复库存。
+"""
+import json
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import delete, insert, select, text, update
+from app import db
+from app.models.order import Order, OrderItem, OrderArchive, OrderItemArchive
+from app.models.product import Product
+from app.models.cart import CartItem
+from app.models.user import Address
+from app.utils import meta
+from app.utils.cache import invalidate_products
+from app.utils.serializers import (
+    load_primary_images, order_query, archived_order_query, serialize_mini_orders
+)
+
+
+ORDER_STATUSES = ('pending', 'paid', 'shipped', 'delivered', 'canceled')
+
+
+class OrderError(Exception):
+    """下单校验失败，消息可以直接返回给客户端"""
+
+
+def _consolidate(items):
+    """合并同一商品的数量，返回 {product_id: quantity}，保持首次出现的顺序"""
+    quantities = OrderedDict()
+    for item in items:
+        product_id = item.get('product_id')
+        quantity = item.get('quantity', 1)
+        if not product_id or not quantity:
+            continue
+        try:
+            product_id, quantity = int(product_id), int(quantity)
+        except (TypeError, ValueError):
+            raise OrderError('商品ID或数量格式错误')
+        if quantity < 0:
+            raise OrderError('商品数量不能为负数')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def _create_order(user_id, address_id, quantities, order_number, skip_missing):
+    """在当前事务中扣减库存并写入订单和订单项（不提交），返回 (order, lines)"""
+    products = {
+        row.id: row for row in db.session.query(
+            Product.id, Product.name, Product.price, Product.stock, Product.category
+        ).filter(Product.id.in_(list(quantities)))
+    } if quantities else {}
+
+    lines = []
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None:
+            if skip_missing:
+                continue
+            raise OrderError(f'商品ID {product_id} 不存在')
+        # 提前检查以便快速失败，真正的保证由下面的条件更新提供
+        if product.stock < quantity:
+            raise OrderError(f'商品 {product.name} 库存不足')
+        lines.append((product, quantity))
+    if not lines:
+        raise OrderError('订单中没有有效的商品')
+
+    images = load_primary_images([product.id for product, _ in lines])
+    now = datetime.utcnow()
+    decrement = update(Product.__table__).where(
+        Product.__table__.c.id == db.bindparam('product_id'),
+        Product.__table__.c.stock >= db.bindparam('quantity')
+    ).values(
+        stock=Product.__table__.c.stock - db.bindparam('quantity'),
+        updated_at=now
+    )
+    for product, quantity in lines:
+        result = db.session.execute(decrement, {'product_id': product.id, 'quantity': quantity})
+        if result.rowcount != 1:
+            raise OrderError(f'商品 {product.name} 库存不足')
+
+    order = Order(
+        user_id=user_id,
+        address_id=address_id,
+        order_number=order_number,
+        status='pending',
+        total_amount=round(sum(product.price * quantity for product, quantity in lines), 2)
+    )
+    db.session.add(order)
+    db.session.flush()  # 获取订单ID
+
+    db.session.execute(insert(OrderItem), [
+        {
+            'order_id': order.id, 'product_id': product.id, 'quantity': quantity, 'price': product.price,
+            'product_name': product.name, 'product_image': images.get(product.id),
+            'product_category': product.category
+        }
+        for product, quantity in lines
+    ])
+    refresh_detail_snapshots([order.id])
+    return order, lines
+
+
+def place_order(user_id, address_id, items, order_number, skip_missing=False):
+    """创建订单并扣减库存，成功时返回已提交的 Order
+
+    items 为 [{'product_id': ..., 'quantity': ...}]；skip_missing 为 True 时忽略不存在的商品，
+    否则抛出 OrderError。库存不足时抛出 OrderError，数据库不做任何修改。
+    """
+    quantities = _consolidate(items)
+    try:
+        order, lines = _create_order(user_id, address_id, quantities, order_number, skip_missing)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    invalidate_products([product.id for product, _ in lines])
+    return order
+
+
+def checkout_cart(user_id, address_id, cart_item_ids, order_number, expected_total=None):
+    """把用户选中的购物车项转换为订单，成功时返回已提交的 Order
+
+    按商品当前价格和库存下单，下单成功的购物车项在同一事务中删除。传入 expected_total
+    （客户端展示的应付金额）且与按当前价格计算的金额不一致时抛出 OrderError，不做任何修改。
+    """
+    cart_item_ids = list(dict.fromkeys(cart_item_ids))
+    rows = db.session.execute(
+        select(CartItem.id, CartItem.product_id, CartItem.quantity)
+        .where(CartItem.user_id == user_id, CartItem.id.in_(cart_item_ids))
+        .order_by(CartItem.id)
+    ).all()
+    if len(rows) != len(cart_item_ids):
+        raise OrderError('部分购物车项不存在，请刷新购物车后重试')
+    if not db.session.query(Address.id).filter_by(id=address_id, user_id=user_id).first():
+        raise OrderError('收货地址不存在')
+
+    quantities = _consolidate({'product_id': row.product_id, 'quantity': row.quantity} for row in rows)
+    try:
+        order, lines = _create_order(user_id, address_id, quantities, order_number, skip_missing=False)
+        if expected_total is not None and abs(float(expected_total) - order.total_amount) >= 0.01:
+            raise OrderError(f'商品价格已变动，应付金额为 {order.total_amount:.2f}，请确认后重新提交')
+        db.session.execute(delete(CartItem).where(CartItem.id.in_(cart_item_ids)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    invalidate_products([product.id for product, _ in lines])
+    return order
+
+
+def _write_detail_snapshots(model, rows):
+    """把 rows 的详情快照写回 model 对应的表，updated_at 保持不变"""
+    if not rows:
+        return {}
+    payloads = {data['order_id']: data for data in serialize_mini_orders(rows, detail=True)}
+    table = model.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.id == db.bindparam('order_id'))
+        .values(detail_snapshot=db.bindparam('snapshot'), updated_at=db.bindparam('row_updated_at')),
+        [{
+            'order_id': row.id,
+            'snapshot': json.dumps(payloads[row.id], ensure_ascii=False),
+            'row_updated_at': row.updated_at
+        } for row in rows]
+    )
+    return payloads
+
+
+def refresh_detail_snapshots(order_ids):
+    """重新生成订单的详情快照，在修改订单的事务中、提交之前调用"""
+    if not order_ids:
+        return
+    db.session.flush()
+    _write_detail_snapshots(Order, order_query().filter(Order.id.in_(order_ids)).all())
+
+
+def order_detail(order_id, user_id):
+    """小程序订单详情：读取快照，不在 orders 中时查询归档表；没有快照的旧订单生成后保存
+
+    订单不存在或不属于该用户时返回 None。
+    """
+    for model, query in ((Order, order_query), (OrderArchive, archived_order_query)):
+        row = db.session.query(model.user_id, model.detail_snapshot).filter(model.id == order_id).first()
+        if row is None:
+            continue
+        if row.user_id != user_id:
+            return None
+        if row.detail_snapshot:
+            return json.loads(row.detail_snapshot)
+        payloads = _write_detail_snapshots(model, query().filter(model.id == order_id).all())
+        db.session.commit()
+        return payloads[order_id]
+    return None
+
+
+def fill_item_snapshots():
+    """为还没有商品快照的订单项（含归档订单项）从当前商品信息回填，不提交事务
+
+    下单时已写入快照，只有绕过下单流程直接插入的订单项（测试数据、脚本）需要调用。
+    """
+    for table in (OrderItem.__tablename__, OrderItemArchive.__tablename__):
+        db.session.execute(text(
+            f'UPDATE {table} SET '
+            f'product_name = (SELECT name FROM products WHERE products.id = {table}.product_id), '
+            f'product_category = (SELECT category FROM products WHERE products.id = {table}.product_id), '
+            f'product_image = (SELECT url FROM product_images WHERE product_images.product_id = {table}.product_id '
+            f'ORDER BY is_primary DESC, id LIMIT 1) '
+            f'WHERE product_name IS NULL AND product_id IN (SELECT id FROM products)'
+        ))
+
+
+def backfill_item_snapshots():
+    """迁移：快照列加入前的订单项回填一次，完成后记入 app_meta，之后启动时不再扫描订单项表"""
+    if meta.get_value(meta.ITEM_SNAPSHOTS_BACKFILLED):
+        return
+    fill_item_snapshots()
+    meta.set_value(meta.ITEM_SNAPSHOTS_BACKFILLED, 1)
+
+
+def check_transition(current, target):
+    """校验订单状态变更，合法时返回 None，否则返回错误信息"""
+    if target not in ORDER_STATUSES:
+        return '无效的状态值'
+    # 已发货的订单不能取消
+    if current == 'shipped' and target == 'canceled':
+        return '已发货的订单不能取消'
+    return None
+
+
+def restock_orders(order_ids):
+    """恢复订单占用的库存：按商品汇总数量，每个商品一条 UPDATE，返回涉及的商品 id"""
+    if not order_ids:
+        return []
+    totals = db.session.execute(
+        select(OrderItem.product_id, db.func.sum(OrderItem.quantity))
+        .where(OrderItem.order_id.in_(order_ids))
+        .group_by(OrderItem.product_id)
+    ).all()
+    if not totals:
+        return []
+    products = Product.__table__
+    db.session.execute(
+        update(products)
+        .where(products.c.id == db.bindparam('product_id'))
+        .values(stock=products.c.stock + db.bindparam('quantity'), updated_at=datetime.utcnow()),
+        [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in totals]
+    )
+    return [product_id for product_id, _ in totals]
+
+
+def bulk_update_status(order_ids, target):
+    """批量变更订单状态，返回每个订单的处理结果
+
+    用集合方式执行：一次查询当前状态，一条 UPDATE 修改所有合法的订单（条件中再次限定当前状态，
+    并发修改过的订单不会被覆盖），取消时一次汇总恢复库存。
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    current = dict(db.session.execute(
+        select(Order.id, Order.status).where(Order.id.in_(order_ids))
+    ).all())
+
+    results = {}
+    candidates = []
+    for order_id in order_ids:
+        if order_id not in current:
+            results[order_id] = {'order_id': order_id, 'success': False, 'message': '订单不存在'}
+            continue
+        error = check_transition(current[order_id], target)
+        if error:
+            results[order_id] = {'order_id': order_id, 'success': False, 'message': error}
+        elif current[order_id] == target:
+            results[order_id] = {'order_id': order_id, 'success': True, 'message': '状态未变化'}
+        else:
+            candidates.append(order_id)
+
+    from_statuses = [status for status in ORDER_STATUSES
+                     if status != target and check_transition(status, target) is None]
+    orders = Order.__table__
+    stmt = update(orders).where(
+        orders.c.id.in_(candidates), orders.c.status.in_(from_statuses)
+    ).values(status=target, updated_at=datetime.utcnow())
+
+    restocked_ids = []
+    try:
+        if not candidates:
+            changed = []
+        elif db.engine.dialect.update_returning:
+            changed = db.session.execute(stmt.returning(orders.c.id)).scalars().all()
+        else:
+            changed = db.session.execute(
+                select(orders.c.id)
+                .where(orders.c.id.in_(candidates), orders.c.status.in_(from_statuses))
+                .with_for_update()
+            ).scalars().all()
+            db.session.execute(stmt)
+        if target == 'canceled':
+            restocked_ids = restock_orders(changed)
+        refresh_detail_snapshots(changed)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    invalidate_products(restocked_ids)
+    changed = set(changed)
+    for order_id in candidates:
+        if order_id in changed:
+            results[order_id] = {'order_id': order_id, 'success': True, 'message': '状态更新成功'}
+        else:
+            results[order_id] = {'order_id': order_id, 'success': False, 'message': '订单状态已被修改，请刷新后重试'}
+    return [results[order_id] for order_id in order_ids]
@@ -0,0 +1,61 @@
+"""分页工具
+
+- clamp_page_size: 限制 per_page/size，避免单次请求拉取整张表
+- keyset_paginate: 按 (created_at, id) 倒序的游标分页，直接定位到下一页且不执行 COUNT
+"""
+import base64
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    """游标格式错误"""
+
+
+def clamp_page_size(value, default=10):
+    """把页大小限制在 1 ~ MAX_PAGE_SIZE 之间"""
+    max_size = current_app.config.get('MAX_PAGE_SIZE', 100)
+    if not value or value < 1:
+        return default
+    return min(value, max_size)
+
+
+def encode_cursor(created_at, id):
+    raw = f"{created_at.isoformat() if created_at else ''}|{id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标为 (created_at, id)，created_at 可能为 None"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return (datetime.fromisoformat(created_at) if created_at else None), int(id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f'无效的分页游标: {cursor}') from e
+
+
+def keyset_paginate(query, model, cursor, size):
+    """按 created_at DESC, id DESC 取一页，返回 (rows, next_cursor)
+
+    cursor 为空字符串表示第一页；next_cursor 为 None 表示没有更多数据。
+    SQLite 倒序时 created_at 为 NULL 的行排在最后，这里一并处理。
+    """
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        if created_at is None:
+            query = query.filter(model.created_at.is_(None), model.id < last_id)
+        else:
+            query = query.filter(or_(
+                model.created_at < created_at,
+                and_(model.created_at == created_at, model.id < last_id),
+                model.created_at.is_(None)
+            ))
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(size + 1).all()
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
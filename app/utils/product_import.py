@@ -0,0 +1,319 @@
+"""商品批量导入（CSV / JSON Lines）
+
+逐行流式读取文件，按 sku 新增或更新商品及图片，每 BATCH_SIZE 行一个事务：
+- 每批只用一次 IN 查询加载已存在的商品，新增和更新分别用批量 INSERT / UPDATE，
+  图片、标签、全文索引、分类商品数同样按批写入
+- 批量写入出错时回滚该批，改为逐行在保存点内写入，单行出错只跳过该行并记录错误
+- 每批提交后清空 session，内存占用与文件大小无关
+
+CSV 表头与 JSON 字段相同：sku, name, price, stock, category, description,
+eco_friendly, eco_labels, material, carbon_footprint, images。
+CSV 中 eco_labels 用逗号分隔，images 用竖线 | 分隔。
+"""
+import csv
+import json
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload
+from app import db
+from app.models.product import Product, ProductImage
+from app.utils import search
+from app.utils.tags import parse_labels, join_labels, set_tags_many, set_product_tags
+from app.utils.cache import invalidate_products
+from app.utils.categories import (
+    adjust_category_counts, get_or_create_category_ids, set_product_category
+)
+
+BATCH_SIZE = 500
+
+# 报告中最多保留的错误条数，避免错误过多时报告本身占用大量内存
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ('csv', 'jsonl')
+
+# 可直接写入 products 表的字段及新增商品时的默认值
+PRODUCT_FIELDS = {
+    'name': None,
+    'description': None,
+    'price': None,
+    'stock': 0,
+    'material': None,
+    'carbon_footprint': None,
+    'eco_friendly': False,
+    'eco_labels': None,
+}
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors)
+        }
+
+
+def detect_format(filename):
+    """根据文件扩展名判断格式"""
+    lower = (filename or '').lower()
+    if lower.endswith('.csv'):
+        return 'csv'
+    if lower.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return None
+
+
+def iter_rows(stream, fmt):
+    """逐行读取文本流，产出 (行号, dict)；无法解析的行产出 (行号, 错误信息)"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # 去掉空单元格，视为未提供该字段
+            yield reader.line_num, {k: v for k, v in row.items() if k and v not in (None, '')}
+    else:
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, f'JSON 解析失败: {str(e)}'
+                continue
+            if not isinstance(row, dict):
+                yield line_no, '每行必须是 JSON 对象'
+                continue
+            yield line_no, row
+
+
+def _to_list(value, separator):
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value).split(separator) if v.strip()]
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', '是')
+
+
+def normalize_row(row):
+    """校验并转换一行数据，返回只包含已提供字段的 dict，数据不合法时抛出 ValueError"""
+    sku = str(row.get('sku', '')).strip()
+    if not sku:
+        raise ValueError('缺少 sku')
+
+    data = {'sku': sku}
+    for key in ('name', 'description', 'category', 'material'):
+        if key in row:
+            data[key] = str(row[key]).strip()
+    if 'price' in row:
+        data['price'] = float(row['price'])
+        if data['price'] < 0:
+            raise ValueError('价格不能为负数')
+    if 'stock' in row:
+        data['stock'] = int(row['stock'])
+    if 'carbon_footprint' in row:
+        data['carbon_footprint'] = float(row['carbon_footprint'])
+    if 'eco_friendly' in row:
+        data['eco_friendly'] = _to_bool(row['eco_friendly'])
+    if 'eco_labels' in row:
+        data['eco_labels'] = join_labels(parse_labels(_to_list(row['eco_labels'], ',')))
+    if 'images' in row:
+        data['images'] = _to_list(row['images'], '|')
+    return data
+
+
+def _load_existing(skus):
+    """按 sku 批量查询已存在商品的 id 及写入索引所需的字段"""
+    rows = db.session.query(
+        Product.sku, Product.id, Product.category_id, Product.name,
+        Product.description, Product.material, Product.eco_labels
+    ).filter(Product.sku.in_(skus)).all()
+    return {row.sku: row._asdict() for row in rows}
+
+
+def _write_batch(rows, existing):
+    """以集合方式写入一批数据，返回 (新增数, 更新数, 涉及的商品 id)"""
+    now = datetime.utcnow()
+    category_ids = get_or_create_category_ids(data.get('category') for data in rows)
+    count_deltas = Counter()
+    inserts, updates, index_rows = [], [], []
+
+    for data in rows:
+        values = {key: data[key] for key in PRODUCT_FIELDS if key in data}
+        if 'category' in data:
+            values['category'] = data['category'] or None
+            values['category_id'] = category_ids.get(data['category'])
+
+        old = existing.get(data['sku'])
+        if old:
+            values['id'] = old['id']
+            values['updated_at'] = now
+            if 'category_id' in values and values['category_id'] != old['category_id']:
+                count_deltas[old['category_id']] -= 1
+                count_deltas[values['category_id']] += 1
+            updates.append(values)
+            # 全文索引：合并原字段后整体重写
+            index_rows.append({**old, **values})
+        else:
+            values = {**PRODUCT_FIELDS, 'category': None, 'category_id': None, **values}
+            values.update(sku=data['sku'], created_at=now, updated_at=now)
+            count_deltas[values['category_id']] += 1
+            inserts.append(values)
+            index_rows.append(values)
+
+    if inserts:
+        result = db.session.execute(
+            insert(Product).returning(Product.id, sort_by_parameter_order=True), inserts
+        )
+        for values, new_id in zip(inserts, result.scalars()):
+            values['id'] = new_id
+    if updates:
+        db.session.execute(update(Product), updates)
+
+    # 图片：提供了 images 的商品整体替换
+    sku_to_id = {values['sku']: values['id'] for values in inserts}
+    sku_to_id.update((sku, row['id']) for sku, row in existing.items())
+    with_images = [data for data in rows if 'images' in data]
+    if with_images:
+        db.session.execute(delete(ProductImage).where(
+            ProductImage.product_id.in_([sku_to_id[data['sku']] for data in with_images])
+        ))
+        image_rows = [
+            {'product_id': sku_to_id[data['sku']], 'url': url, 'is_primary': i == 0}
+            for data in with_images
+            for i, url in enumerate(data['images'])
+        ]
+        if image_rows:
+            db.session.execute(insert(ProductImage), image_rows)
+
+    # 标签：提供了 eco_labels 的商品整体替换
+    set_tags_many({
+        sku_to_id[data['sku']]: parse_labels(data['eco_labels'])
+        for data in rows if 'eco_labels' in data
+    })
+
+    adjust_category_counts(count_deltas)
+    search.index_many(index_rows)
+
+    touched_ids = [values['id'] for values in index_rows]
+    return len(inserts), len(updates), touched_ids
+
+
+def _apply_row(product, data):
+    for key in PRODUCT_FIELDS:
+        if key in data:
+            setattr(product, key, data[key])
+    if 'category' in data:
+        set_product_category(product, data['category'])
+    if 'images' in data:
+        # 替换图片，旧图片由 delete-orphan 级联删除
+        product.images = [
+            ProductImage(url=url, is_primary=(i == 0))
+            for i, url in enumerate(data['images'])
+        ]
+    # 只替换图片或标签时 products 行本身不变，显式更新 updated_at（商品 ETag 依赖它）
+    product.updated_at = datetime.utcnow()
+
+
+def _write_rows_one_by_one(batch, report):
+    """逐行在保存点内写入，用于批量写入失败后定位出错的行"""
+    products = {
+        product.sku: product
+        for product in Product.query.options(selectinload(Product.images))
+        .filter(Product.sku.in_([data['sku'] for _, data in batch]))
+    }
+    created, updated, touched_ids = 0, 0, []
+    for line_no, data in batch:
+        product = products.get(data['sku'])
+        try:
+            with db.session.begin_nested():
+                if product is None:
+                    product = Product(sku=data['sku'], stock=0, eco_friendly=False)
+                    db.session.add(product)
+                _apply_row(product, data)
+                db.session.flush()
+                if 'eco_labels' in data:
+                    set_product_tags(product, data['eco_labels'])
+                search.index_product(product)
+        except (SQLAlchemyError, ValueError) as e:
+            report.add_error(line_no, str(e))
+            continue
+        if data['sku'] in products:
+            updated += 1
+        else:
+            created += 1
+        products[data['sku']] = product
+        touched_ids.append(product.id)
+    return created, updated, touched_ids
+
+
+def _apply_batch(batch, report):
+    existing = _load_existing([data['sku'] for _, data in batch])
+
+    # 新商品必须提供名称和价格
+    valid = []
+    for line_no, data in batch:
+        if data['sku'] not in existing and not all(k in data for k in ('name', 'price')):
+            report.add_error(line_no, '新商品缺少 name 或 price')
+        else:
+            valid.append((line_no, data))
+    if not valid:
+        return
+
+    try:
+        created, updated, touched_ids = _write_batch([data for _, data in valid], existing)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"批量写入失败，改为逐行导入: {str(e)}")
+        created, updated, touched_ids = _write_rows_one_by_one(valid, report)
+        db.session.commit()
+
+    report.created += created
+    report.updated += updated
+    invalidate_products(touched_ids, catalog_changed=bool(touched_ids))
+    db.session.expunge_all()
+
+
+def import_products(stream, fmt, batch_size=BATCH_SIZE):
+    """从文本流导入商品，返回 ImportReport"""
+    if fmt not in FORMATS:
+        raise ValueError(f'不支持的导入格式: {fmt}')
+
+    report = ImportReport()
+    batch, batch_skus = [], set()
+    for line_no, row in iter_rows(stream, fmt):
+        if isinstance(row, str):
+            report.add_error(line_no, row)
+            continue
+        try:
+            data = normalize_row(row)
+        except (TypeError, ValueError) as e:
+            report.add_error(line_no, str(e))
+            continue
+        # 同一 sku 在一批中重复出现时先提交前面的行，保证按文件顺序生效
+        if data['sku'] in batch_skus or len(batch) >= batch_size:
+            _apply_batch(batch, report)
+            batch, batch_skus = [], set()
+        batch.append((line_no, data))
+        batch_skus.add(data['sku'])
+    if batch:
+        _apply_batch(batch, report)
+    return report
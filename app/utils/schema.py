@@ -0,0 +1,93 @@
+"""数据库结构升级
+
+项目没有使用迁移工具，线上数据库由 db.create_all() 创建。
+这里在已有数据库上补齐新增的表、列和索引，并依次执行数据迁移步骤。
+所有步骤都可以重复执行，应用启动和 init-db 时都会调用。
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateTable
+from app import db
+
+
+def _migrations():
+    """按顺序返回数据迁移步骤（延迟导入，避免循环引用）"""
+    from app.utils import search, categories, tags, order_service, cart, archive
+    return [
+        search.ensure_search_index,
+        categories.backfill_categories,
+        tags.backfill_product_tags,
+        order_service.backfill_item_snapshots,
+        cart.merge_duplicate_cart_items,
+        cart.ensure_autoincrement_id,
+        archive.ensure_autoincrement_ids,
+    ]
+
+
+def _add_missing_columns():
+    """为已存在的表补齐模型中新增的列"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    dialect = db.engine.dialect
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns or column.primary_key:
+                continue
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect)}'
+            if column.server_default is not None:
+                ddl += f' DEFAULT {column.server_default.arg}'
+            try:
+                db.session.execute(text(ddl))
+                db.session.commit()
+                print(f"已添加列 {table.name}.{column.name}")
+            except OperationalError as e:
+                # 多个 worker 同时启动时可能已被其他进程添加
+                db.session.rollback()
+                print(f"添加列 {table.name}.{column.name} 失败: {str(e)}")
+
+
+def rebuild_sqlite_table(table):
+    """按模型重建 SQLite 表并保留数据，用于 ALTER TABLE 做不到的修改（如主键加 AUTOINCREMENT）
+
+    不提交事务；旧表的索引随表删除，由 _create_missing_indexes 重新创建。
+    """
+    tmp = f'{table.name}_rebuild'
+    ddl = str(CreateTable(table).compile(db.engine))
+    ddl = ddl.replace(f'CREATE TABLE {table.name} (', f'CREATE TABLE {tmp} (', 1)
+    columns = ', '.join(column.name for column in table.columns)
+    db.session.execute(text(f'DROP TABLE IF EXISTS {tmp}'))
+    db.session.execute(text(ddl))
+    db.session.execute(text(f'INSERT INTO {tmp} ({columns}) SELECT {columns} FROM {table.name}'))
+    db.session.execute(text(f'DROP TABLE {table.name}'))
+    db.session.execute(text(f'ALTER TABLE {tmp} RENAME TO {table.name}'))
+    print(f"已重建表 {table.name}")
+
+
+def _create_missing_indexes():
+    """为已存在的表补齐模型中新增的索引"""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing_indexes = {idx['name'] for idx in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            try:
+                index.create(db.engine)
+                print(f"已创建索引 {index.name}")
+            except OperationalError as e:
+                print(f"创建索引 {index.name} 失败: {str(e)}")
+
+
+def upgrade_schema():
+    """补齐数据库结构并执行数据迁移"""
+    import app.models  # 确保所有模型已注册到 metadata
+    db.create_all()
+    _add_missing_columns()
+    for step in _migrations():
+        step()
+        db.session.commit()
+    _create_missing_indexes()
@@ -0,0 +1,153 @@
+"""商品全文检索（SQLite FTS5）
+
+FTS5 自带的分词器无法切分中文，这里在写入前先把文本切成二元组（bigram）：
+"实木书桌" 写入为 "实木 木书 书桌 桌"，每个中文片段额外保留末尾单字，
+这样单字查询也能通过前缀匹配命中。查询时按同样规则切分并以短语匹配，
+结果按 bm25 相关度排序。
+"""
+import re
+from sqlalchemy import Float, Integer, text
+from app import db
+
+SEARCH_TABLE = 'product_search'
+
+# 各列在 bm25 中的权重：名称 > 材质/环保标签 > 描述
+_BM25_WEIGHTS = '10.0, 2.0, 4.0, 4.0'
+
+_CJK_RANGE = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(f'([{_CJK_RANGE}]+)|([^\\W_{_CJK_RANGE}]+)')
+
+
+def is_enabled():
+    """全文检索仅在 SQLite 下可用，其他数据库回退到 LIKE 查询"""
+    return db.engine.dialect.name == 'sqlite'
+
+
+def tokenize(value):
+    """把文本切分为写入索引的词元：中文按二元组切分，其余按单词小写"""
+    if not value:
+        return ''
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(value):
+        if cjk:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            tokens.append(cjk[-1])
+        else:
+            tokens.append(word.lower())
+    return ' '.join(tokens)
+
+
+def build_match_query(keyword):
+    """把用户输入的关键词转换为 FTS5 MATCH 表达式，没有有效词元时返回 None"""
+    phrases = []
+    for cjk, word in _TOKEN_RE.findall(keyword or ''):
+        if cjk and len(cjk) > 1:
+            bigrams = ' '.join(cjk[i:i + 2] for i in range(len(cjk) - 1))
+            phrases.append(f'"{bigrams}"')
+        elif cjk:
+            phrases.append(f'"{cjk}"*')
+        else:
+            phrases.append(f'"{word.lower()}"*')
+    return ' '.join(phrases) if phrases else None
+
+
+def _row_params(product):
+    return {
+        'id': product.id,
+        'name': tokenize(product.name),
+        'description': tokenize(product.description),
+        'material': tokenize(product.material),
+        'eco_labels': tokenize(product.eco_labels),
+    }
+
+
+def _values_params(values):
+    return {
+        'id': values['id'],
+        'name': tokenize(values.get('name')),
+        'description': tokenize(values.get('description')),
+        'material': tokenize(values.get('material')),
+        'eco_labels': tokenize(values.get('eco_labels')),
+    }
+
+
+def index_product(product):
+    """写入或更新单个商品的索引，需在同一事务中调用（商品须已 flush 获得 id）"""
+    if not is_enabled():
+        return
+    db.session.execute(text(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = :id'), {'id': product.id})
+    db.session.execute(
+        text(f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, material, eco_labels) '
+             'VALUES (:id, :name, :description, :material, :eco_labels)'),
+        _row_params(product)
+    )
+
+
+def index_many(rows):
+    """批量写入索引，rows 为包含 id、name、description、material、eco_labels 的 dict 列表"""
+    if not is_enabled() or not rows:
+        return
+    db.session.execute(
+        text(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = :id'),
+        [{'id': row['id']} for row in rows]
+    )
+    _insert_rows([_values_params(row) for row in rows])
+
+
+def remove_product(product_id):
+    """从索引中删除商品"""
+    if not is_enabled():
+        return
+    db.session.execute(text(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = :id'), {'id': product_id})
+
+
+def rebuild_search_index():
+    """按 products 表全量重建索引"""
+    from app.models.product import Product
+
+    db.session.execute(text(f'DELETE FROM {SEARCH_TABLE}'))
+    batch = []
+    for product in Product.query.yield_per(500):
+        batch.append(_row_params(product))
+        if len(batch) >= 500:
+            _insert_rows(batch)
+            batch = []
+    if batch:
+        _insert_rows(batch)
+    db.session.commit()
+
+
+def _insert_rows(rows):
+    db.session.execute(
+        text(f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, material, eco_labels) '
+             'VALUES (:id, :name, :description, :material, :eco_labels)'),
+        rows
+    )
+
+
+def ensure_search_index():
+    """创建索引表；索引行数与商品数不一致时（新建或 init_db 重建数据后）全量重建"""
+    if not is_enabled():
+        return
+    db.session.execute(text(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} '
+        "USING fts5(name, description, material, eco_labels, tokenize='unicode61')"
+    ))
+    indexed = db.session.execute(text(f'SELECT count(*) FROM {SEARCH_TABLE}')).scalar()
+    products = db.session.execute(text('SELECT count(*) FROM products')).scalar()
+    if indexed != products:
+        print(f"重建商品全文索引: 索引 {indexed} 条, 商品 {products} 条")
+        rebuild_search_index()
+
+
+def match_subquery(keyword):
+    """返回 (product_id, score) 子查询，score 越小越相关；无法使用全文检索时返回 None"""
+    if not is_enabled():
+        return None
+    match = build_match_query(keyword)
+    if match is None:
+        return None
+    return text(
+        f'SELECT rowid AS product_id, bm25({SEARCH_TABLE}, {_BM25_WEIGHTS}) AS score '
+        f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match'
+    ).bindparams(match=match).columns(product_id=Integer, score=Float).subquery('product_matches')
@@ -0,0 +1,349 @@
+"""响应序列化
+
+列表接口只查询需要的列（返回 Row 元组），不加载完整的 ORM 对象；
+图片、订单项、地址等关联数据按 id 用一次 IN 查询批量获取。
+图片等相对路径统一在 absolute_url 中转换为完整 URL。
+"""
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import select
+from app import db
+from app.models.product import Product, ProductImage
+from app.models.order import Order, OrderItem, OrderArchive, OrderItemArchive
+from app.models.user import User, Address
+from app.models.cart import CartItem
+
+DEFAULT_PRODUCT_IMAGE = '/static/images/product/default.jpg'
+
+ORDER_STATUS_TEXT = {
+    'pending': '待付款',
+    'paid': '已支付',
+    'shipped': '已发货',
+    'delivered': '已送达',
+    'canceled': '已取消'
+}
+
+
+def absolute_url(path):
+    """把站内相对路径转换为完整 URL，已是完整 URL 的原样返回"""
+    if path and path.startswith('/'):
+        return f"{current_app.config['PUBLIC_BASE_URL']}{path}"
+    return path
+
+
+def format_time(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+def status_text(status):
+    return ORDER_STATUS_TEXT.get(status, '未知状态')
+
+
+# ---------------------------------------------------------------- 商品
+
+PRODUCT_COLUMNS = (
+    Product.id, Product.sku, Product.name, Product.description, Product.price,
+    Product.stock, Product.category, Product.category_id, Product.created_at,
+    Product.eco_friendly, Product.eco_labels, Product.material, Product.carbon_footprint
+)
+
+
+def product_query():
+    """只选择序列化所需列的商品查询"""
+    return db.session.query(*PRODUCT_COLUMNS)
+
+
+def load_product_images(product_ids):
+    """批量查询商品图片，返回 {product_id: [url, ...]}"""
+    images = defaultdict(list)
+    if not product_ids:
+        return images
+    rows = db.session.query(ProductImage.product_id, ProductImage.url) \
+        .filter(ProductImage.product_id.in_(set(product_ids))) \
+        .order_by(ProductImage.product_id, ProductImage.id)
+    for product_id, url in rows:
+        images[product_id].append(url)
+    return images
+
+
+def load_primary_images(product_ids):
+    """批量查询商品主图（is_primary 优先，其次最早添加的图片），返回 {product_id: url}"""
+    if not product_ids:
+        return {}
+    rows = db.session.query(ProductImage.product_id, ProductImage.url) \
+        .filter(ProductImage.product_id.in_(set(product_ids))) \
+        .order_by(ProductImage.product_id, ProductImage.is_primary.desc(), ProductImage.id)
+    images = {}
+    for product_id, url in rows:
+        images.setdefault(product_id, url)
+    return images
+
+
+def _eco_labels(value):
+    return value.split(',') if value else []
+
+
+def product_dict(row, images, absolute=False):
+    """与 Product.to_dict 相同的结构（管理端接口）"""
+    return {
+        'id': row.id,
+        'sku': row.sku,
+        'name': row.name,
+        'description': row.description,
+        'price': row.price,
+        'stock': row.stock,
+        'category': row.category,
+        'category_id': row.category_id,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'eco_friendly': row.eco_friendly,
+        'eco_labels': _eco_labels(row.eco_labels),
+        'material': row.material,
+        'carbon_footprint': row.carbon_footprint,
+        'images': [absolute_url(url) for url in images] if absolute else list(images)
+    }
+
+
+def _image_fields(images):
+    urls = [absolute_url(url) for url in images] or [absolute_url(DEFAULT_PRODUCT_IMAGE)]
+    return urls[0], urls
+
+
+def product_card(row, images):
+    """小程序商品列表项"""
+    image, urls = _image_fields(images)
+    return {
+        'product_id': row.id,
+        'name': row.name,
+        'description': row.description,
+        'price': row.price,
+        'category_id': row.category_id,
+        'category_name': row.category,
+        'image': image,
+        'images': urls,
+        'create_time': format_time(row.created_at)
+    }
+
+
+def product_detail(row, images):
+    """小程序商品详情"""
+    image, urls = _image_fields(images)
+    return {
+        'product_id': row.id,
+        'name': row.name,
+        'description': row.description,
+        'content': row.description,
+        'price': row.price,
+        'category_id': row.category_id,
+        'category_name': row.category,
+        'material': row.material,
+        'carbon_footprint': row.carbon_footprint,
+        'eco_labels': _eco_labels(row.eco_labels),
+        'image': image,
+        'images': urls,
+        'create_time': format_time(row.created_at)
+    }
+
+
+def serialize_products(rows, builder, **kwargs):
+    """批量加载图片后逐行序列化商品"""
+    images = load_product_images([row.id for row in rows])
+    return [builder(row, images.get(row.id, []), **kwargs) for row in rows]
+
+
+# ---------------------------------------------------------------- 订单
+
+def _order_columns(model, archived):
+    return (
+        model.id, model.user_id, model.order_number, model.status, model.total_amount,
+        model.address_id, model.created_at, model.updated_at,
+        User.username.label('username'), User.email.label('email'),
+        db.literal(archived).label('archived')
+    )
+
+
+ADDRESS_COLUMNS = (
+    Address.id, Address.user_id, Address.province, Address.city, Address.district,
+    Address.detail, Address.name, Address.phone, Address.is_default
+)
+
+
+def order_query():
+    """只选择序列化所需列的订单查询（含下单用户）"""
+    return db.session.query(*_order_columns(Order, False)).join(User, User.id == Order.user_id)
+
+
+def archived_order_query():
+    """与 order_query 相同的列，查询归档订单"""
+    return db.session.query(*_order_columns(OrderArchive, True)) \
+        .join(User, User.id == OrderArchive.user_id)
+
+
+def load_order_items(order_ids, model=OrderItem):
+    """批量查询订单项（含下单时的商品快照），返回 {order_id: [row, ...]}；model 为 OrderItemArchive 时查询归档表"""
+    items = defaultdict(list)
+    if not order_ids:
+        return items
+    rows = db.session.query(
+        model.id, model.order_id, model.product_id, model.quantity, model.price,
+        model.product_name, model.product_image, model.product_category
+    ).filter(model.order_id.in_(set(order_ids))) \
+        .order_by(model.order_id, model.id)
+    for row in rows:
+        items[row.order_id].append(row)
+    return items
+
+
+def load_addresses(address_ids):
+    """批量查询地址，返回 {address_id: dict}"""
+    if not address_ids:
+        return {}
+    rows = db.session.query(*ADDRESS_COLUMNS).filter(Address.id.in_(set(address_ids)))
+    return {row.id: row._asdict() for row in rows}
+
+
+def order_item_dict(row):
+    """与 OrderItem.to_dict 相同的结构"""
+    return {
+        'id': row.id,
+        'order_id': row.order_id,
+        'product_id': row.product_id,
+        'product_name': row.product_name,
+        'quantity': row.quantity,
+        'price': row.price,
+        'subtotal': row.price * row.quantity
+    }
+
+
+def serialize_orders(rows):
+    """与 Order.to_dict 相同的结构（管理端接口），订单项和地址各用一次查询加载"""
+    items = load_order_items([row.id for row in rows if not row.archived])
+    items.update(load_order_items([row.id for row in rows if row.archived], OrderItemArchive))
+    addresses = load_addresses([row.address_id for row in rows])
+    return [{
+        'id': row.id,
+        'user_id': row.user_id,
+        'user': {
+            'id': row.user_id,
+            'username': row.username,
+            'email': row.email
+        },
+        'order_number': row.order_number,
+        'status': row.status,
+        'total_amount': row.total_amount,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+        'items': [order_item_dict(item) for item in items.get(row.id, [])],
+        'address': addresses.get(row.address_id)
+    } for row in rows]
+
+
+def mini_order_item(item, product_name, product_image, with_total=False):
+    """小程序订单项"""
+    data = {
+        'id': item.id,
+        'product_id': item.product_id,
+        'name': product_name,
+        'image': absolute_url(product_image),
+        'price': float(item.price) if item.price else 0,
+        'quantity': item.quantity
+    }
+    if with_total:
+        data['total'] = float(item.price * item.quantity) if item.price else 0
+    return data
+
+
+def mini_order(order, **extra):
+    """小程序订单概要，extra 追加到末尾（如 items、address）"""
+    data = {
+        'order_id': order.id,
+        'order_number': order.order_number,
+        'status': order.status,
+        'status_text': status_text(order.status),
+        'total_amount': round(float(order.total_amount), 2) if order.total_amount else 0,
+        'create_time': format_time(order.created_at)
+    }
+    data.update(extra)
+    return data
+
+
+MINI_ADDRESS_FIELDS = ('id', 'name', 'phone', 'province', 'city', 'district', 'detail', 'is_default')
+
+
+def serialize_mini_orders(rows, detail=False):
+    """小程序订单列表 / 详情，rows 来自 order_query / archived_order_query
+
+    订单项（含商品快照）用一次查询加载，详情另外一次查询加载收货地址。
+    """
+    items = load_order_items([row.id for row in rows if not row.archived])
+    items.update(load_order_items([row.id for row in rows if row.archived], OrderItemArchive))
+    addresses = load_addresses([row.address_id for row in rows if row.address_id]) if detail else {}
+
+    orders = []
+    for row in rows:
+        order_items = [
+            mini_order_item(
+                item,
+                item.product_name or '未知商品',
+                item.product_image or '',
+                with_total=detail
+            )
+            for item in items.get(row.id, [])
+        ]
+        if not detail:
+            orders.append(mini_order(row, items=order_items))
+            continue
+        address = addresses.get(row.address_id)
+        orders.append(mini_order(
+            row,
+            update_time=format_time(row.updated_at),
+            address={key: address[key] for key in MINI_ADDRESS_FIELDS} if address else None,
+            items=order_items
+        ))
+    return orders
+
+
+# ---------------------------------------------------------------- 购物车
+
+def _primary_image_subquery(product_id):
+    """商品主图 URL 的标量子查询（is_primary 优先，其次最早添加的图片）"""
+    return select(ProductImage.url) \
+        .where(ProductImage.product_id == product_id) \
+        .order_by(ProductImage.is_primary.desc(), ProductImage.id) \
+        .limit(1).correlate_except(ProductImage).scalar_subquery()
+
+
+def cart_item_status(product_exists, stock, quantity):
+    """购物车项状态：normal / deleted（商品已删除）/ out_of_stock（无库存）/ insufficient_stock（库存不足）"""
+    if not product_exists:
+        return 'deleted'
+    if not stock or stock <= 0:
+        return 'out_of_stock'
+    if stock < quantity:
+        return 'insufficient_stock'
+    return 'normal'
+
+
+def load_cart(user_id):
+    """购物车列表：购物车项、商品信息和主图用一条查询获取，商品已删除或库存不足的项带上标记"""
+    rows = db.session.query(
+        CartItem.id, CartItem.product_id, CartItem.quantity,
+        Product.id.label('product_exists'), Product.name, Product.price, Product.stock,
+        _primary_image_subquery(CartItem.product_id).label('image')
+    ).outerjoin(Product, Product.id == CartItem.product_id) \
+        .filter(CartItem.user_id == user_id) \
+        .order_by(CartItem.id)
+    items = []
+    for row in rows:
+        status = cart_item_status(row.product_exists, row.stock, row.quantity)
+        items.append({
+            'id': row.id,
+            'product_id': row.product_id,
+            'quantity': row.quantity,
+            'name': row.name if status != 'deleted' else '商品已删除',
+            'price': row.price if status != 'deleted' else 0,
+            'image': absolute_url(row.image) if row.image else '',
+            'stock': row.stock or 0,
+            'status': status,
+            'available': status == 'normal'
+        })
+    return items
@@ -0,0 +1,85 @@
+"""商品环保标签维护
+
+products.eco_labels 保留逗号分隔的标签名称用于展示，同时写入 tags / product_tags
+两张表，按标签筛选和统计标签分面时只查关联表，不再拆分字符串。
+"""
+from sqlalchemy import delete, insert, text
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.product import Tag, product_tags
+
+
+def parse_labels(value):
+    """把列表或逗号分隔的字符串转换为去重后的标签名称列表（保持原顺序）"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    labels = []
+    for label in value:
+        label = str(label).strip()
+        if label and label not in labels:
+            labels.append(label)
+    return labels
+
+
+def join_labels(labels):
+    return ','.join(labels)
+
+
+def get_or_create_tag_ids(names):
+    """批量获取标签 id，不存在的标签一并创建，返回 {名称: id}"""
+    names = set(names)
+    if not names:
+        return {}
+    ids = dict(db.session.query(Tag.name, Tag.id).filter(Tag.name.in_(names)).all())
+    for name in names - ids.keys():
+        try:
+            # 使用保存点，并发创建同名标签时回退到查询
+            with db.session.begin_nested():
+                tag = Tag(name=name)
+                db.session.add(tag)
+            ids[name] = tag.id
+        except IntegrityError:
+            ids[name] = db.session.query(Tag.id).filter_by(name=name).scalar()
+    return ids
+
+
+def set_tags_many(labels_by_product):
+    """按 {商品 id: [标签名称]} 整体替换商品的标签"""
+    if not labels_by_product:
+        return
+    tag_ids = get_or_create_tag_ids(
+        name for labels in labels_by_product.values() for name in labels
+    )
+    db.session.execute(delete(product_tags).where(
+        product_tags.c.product_id.in_(list(labels_by_product))
+    ))
+    rows = [
+        {'product_id': product_id, 'tag_id': tag_ids[name]}
+        for product_id, labels in labels_by_product.items()
+        for name in labels
+    ]
+    if rows:
+        db.session.execute(insert(product_tags), rows)
+
+
+def set_product_tags(product, value):
+    """设置商品标签，同时更新 eco_labels 字符串；商品需已 flush 取得 id"""
+    labels = parse_labels(value)
+    product.eco_labels = join_labels(labels)
+    set_tags_many({product.id: labels})
+
+
+def remove_product_tags(product_id):
+    db.session.execute(delete(product_tags).where(product_tags.c.product_id == product_id))
+
+
+def backfill_product_tags():
+    """迁移：为还没有标签关联的商品按 eco_labels 字符串建立关联"""
+    rows = db.session.execute(text(
+        "SELECT id, eco_labels FROM products "
+        "WHERE eco_labels IS NOT NULL AND eco_labels != '' "
+        "AND id NOT IN (SELECT product_id FROM product_tags)"
+    )).all()
+    set_tags_many({row.id: parse_labels(row.eco_labels) for row in rows})
@@ -1,4 +1,7 @@
-from app import create_app, db
+from app import create_app
+from app.utils.schema import upgrade_schema
+from app.utils.product_import import import_products, detect_format, FORMATS, BATCH_SIZE
+from app.utils import archive, order_number, benchmark
 import click
 from flask.cli import with_appcontext
 
@@ -8,10 +11,70 @@ app = create_app()
 @with_appcontext
 def init_db_command():
     """初始化数据库."""
-    db.create_all()
+    upgrade_schema()
     click.echo('数据库初始化完成.')
 
+@click.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None, help='文件格式，默认按扩展名判断')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='每个事务处理的行数')
+@with_appcontext
+def import_products_command(path, fmt, batch_size):
+    """从 CSV / JSON Lines 文件批量导入或更新商品."""
+    fmt = fmt or detect_format(path)
+    if fmt is None:
+        raise click.UsageError('无法识别文件格式，请使用 --format 指定')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        report = import_products(f, fmt, batch_size=batch_size)
+    click.echo(f'导入完成: 新增 {report.created}, 更新 {report.updated}, 失败 {report.failed}')
+    for error in report.errors:
+        click.echo(f"  第 {error['line']} 行: {error['error']}")
+
+@click.command('archive-orders')
+@click.option('--days', type=int, default=None, help='归档多少天前的订单，默认使用 ORDER_ARCHIVE_DAYS 配置')
+@click.option('--batch-size', default=archive.BATCH_SIZE, show_default=True, help='每个事务归档的订单数')
+@with_appcontext
+def archive_orders_command(days, batch_size):
+    """把超过保留期的已送达、已取消订单移入归档表."""
+    count = archive.archive_orders(days=days, batch_size=batch_size)
+    click.echo(f'归档完成: 共 {count} 个订单')
+
+@click.command('bench-order-numbers')
+@click.option('--count', default=2000000, show_default=True, help='生成的订单号总数')
+@click.option('--processes', default=4, show_default=True, help='并行生成的进程数')
+def bench_order_numbers_command(count, processes):
+    """多进程批量生成订单号，检查是否有重复."""
+    total, duplicates, elapsed, ordered = order_number.benchmark(count, processes)
+    click.echo(f'生成 {total} 个订单号，重复 {duplicates} 个，耗时 {elapsed:.2f} 秒 '
+               f'({total / elapsed:,.0f} 个/秒)，各进程内{"按时间有序" if ordered else "存在乱序"}')
+    if duplicates:
+        raise click.ClickException('订单号出现重复')
+
+@click.command('bench-product-list')
+@click.option('--products', default=1000, show_default=True, help='造数据的商品数')
+@click.option('--orders', default=500, show_default=True, help='造数据的订单数')
+@click.option('--page-size', default=100, show_default=True, help='每页条数')
+@click.option('--rounds', default=50, show_default=True, help='每个接口请求的次数')
+def bench_product_list_command(products, orders, page_size, rounds):
+    """在临时数据库中测量商品列表、订单列表每次请求的 SQL 语句数和 CPU 耗时（含 ORM to_dict 对照）."""
+    for url, queries, ms in benchmark.product_list_benchmark(products, orders, page_size, rounds):
+        click.echo(f'{url}: {queries} 条 SQL，CPU {ms:.1f} 毫秒/页')
+
+@click.command('bench-cart-list')
+@click.option('--items', default=300, show_default=True, help='购物车中的商品数')
+@click.option('--other-users', default=300, show_default=True, help='其他用户数（每人 20 件商品）')
+@click.option('--rounds', default=20, show_default=True, help='请求次数')
+def bench_cart_list_command(items, other_users, rounds):
+    """在临时数据库中测量购物车列表每次请求的 SQL 语句数和 CPU 耗时."""
+    count, queries, ms = benchmark.cart_list_benchmark(items, other_users, rounds)
+    click.echo(f'/api/cart/list（{count} 件商品）: {queries} 条 SQL，CPU {ms:.1f} 毫秒/次')
+
 app.cli.add_command(init_db_command)
+app.cli.add_command(import_products_command)
+app.cli.add_command(archive_orders_command)
+app.cli.add_command(bench_order_numbers_command)
+app.cli.add_command(bench_product_list_command)
+app.cli.add_command(bench_cart_list_command)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8000) 
\ No newline at end of file
@@ -0,0 +1,57 @@
+import contextlib
+import pytest
+from sqlalchemy import event
+from app import create_app, db
+from app.utils import init_db
+from app.utils.search import rebuild_search_index
+
+
+@pytest.fixture
+def app_config():
+    """测试模块可以覆盖该 fixture，为应用追加配置"""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    """使用临时 SQLite 数据库的应用，预置 init_db 中的测试用户、商品和订单"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.sqlite'}",
+        **app_config,
+    })
+    with app.app_context():
+        init_db.create_test_users()
+        init_db.create_test_products()
+        init_db.create_test_orders()
+        rebuild_search_index()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def count_queries(app):
+    """返回上下文管理器，收集其中执行的 SQL 语句，用于查询次数回归测试"""
+    with app.app_context():
+        engine = db.engine
+
+    @contextlib.contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return counter
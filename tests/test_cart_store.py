@@ -0,0 +1,133 @@
+"""memory 购物车后端：数量修改在内存中合并，写回时只更新仍属于该用户、该商品的购物车项"""
+import pytest
+from app import db
+from app.models.cart import CartItem
+from app.models.order import OrderItem
+from app.models.product import Product
+from app.utils import cart_store
+
+HEADERS = {'Authorization': 'Bearer 2:0'}
+
+
+@pytest.fixture
+def app_config():
+    # 写回间隔足够长，测试中只有显式 flush 和结算会写回
+    return {'CART_BACKEND': 'memory', 'CART_FLUSH_INTERVAL': 3600}
+
+
+@pytest.fixture
+def store(app, monkeypatch):
+    """每个测试使用新的 MemoryCartStore，不与其他测试共享内存中的购物车"""
+    store = cart_store.MemoryCartStore()
+    store.init_app(app)
+    monkeypatch.setattr(cart_store, 'memory_cart_store', store)
+    yield store
+    with app.app_context():
+        store.flush()
+
+
+@pytest.fixture
+def product_ids(app):
+    with app.app_context():
+        products = [Product(name=f'竹制餐具{i}', price=10, stock=100) for i in range(2)]
+        db.session.add_all(products)
+        db.session.commit()
+        return [product.id for product in products]
+
+
+def _row(app, user_id, product_id):
+    with app.app_context():
+        return db.session.execute(
+            db.select(CartItem.id, CartItem.quantity)
+            .where(CartItem.user_id == user_id, CartItem.product_id == product_id)
+        ).first()
+
+
+def _quantities(client):
+    items = client.get('/api/cart/list', headers=HEADERS).get_json()['data']
+    return {item['product_id']: item['quantity'] for item in items}
+
+
+def test_quantity_changes_are_coalesced_until_flush(app, client, store, count_queries, product_ids):
+    product_id = product_ids[0]
+    assert client.post('/api/cart/add', json={'product_id': product_id}, headers=HEADERS).status_code == 200
+
+    with count_queries() as statements:
+        for quantity in (3, 4, 5):
+            assert client.post('/api/cart/update', json={'product_id': product_id, 'quantity': quantity},
+                               headers=HEADERS).status_code == 200
+        assert client.post('/api/cart/add', json={'product_id': product_id}, headers=HEADERS).status_code == 200
+    assert not [statement for statement in statements if statement.startswith('UPDATE cart_items')]
+    assert store._dirty_count == 1
+    assert _row(app, 2, product_id).quantity == 1
+    assert _quantities(client)[product_id] == 6
+
+    with app.app_context():
+        with count_queries() as statements:
+            store.flush()
+    assert len([statement for statement in statements if statement.startswith('UPDATE cart_items')]) == 1
+    assert _row(app, 2, product_id).quantity == 6
+    assert store._dirty_count == 0
+    assert not store._carts
+
+
+def test_explicit_flush_of_one_user(app, client, store, product_ids):
+    other = {'Authorization': 'Bearer 3:0'}
+    for headers in (HEADERS, other):
+        client.post('/api/cart/add', json={'product_id': product_ids[0]}, headers=headers)
+        client.post('/api/cart/update', json={'product_id': product_ids[0], 'quantity': 4}, headers=headers)
+
+    with app.app_context():
+        store.flush(2)
+    assert _row(app, 2, product_ids[0]).quantity == 4
+    assert _row(app, 3, product_ids[0]).quantity == 1
+    assert list(store._dirty) == [3]
+
+
+def test_remove_then_re_add_does_not_resurrect_pending_quantity(app, client, store, product_ids):
+    product_id = product_ids[0]
+    client.post('/api/cart/add', json={'product_id': product_id}, headers=HEADERS)
+    client.post('/api/cart/update', json={'product_id': product_id, 'quantity': 7}, headers=HEADERS)
+    old_id = _row(app, 2, product_id).id
+
+    assert client.delete(f'/api/cart/delete/{product_id}', headers=HEADERS).status_code == 200
+    assert _row(app, 2, product_id) is None
+    assert client.post('/api/cart/add', json={'product_id': product_id}, headers=HEADERS).status_code == 200
+    with app.app_context():
+        store.flush()
+
+    row = _row(app, 2, product_id)
+    assert row.quantity == 1
+    assert row.id != old_id
+
+
+def test_stale_flush_does_not_touch_a_reused_row(app, client, store, product_ids):
+    """取出待写回的修改后，该行被删除、id 被其他用户的新行复用，写回不能改到新行"""
+    client.post('/api/cart/add', json={'product_id': product_ids[0]}, headers=HEADERS)
+    client.post('/api/cart/update', json={'product_id': product_ids[0], 'quantity': 7}, headers=HEADERS)
+    item_id = _row(app, 2, product_ids[0]).id
+    with app.app_context():
+        db.session.execute(db.delete(CartItem).where(CartItem.id == item_id))
+        db.session.add(CartItem(id=item_id, user_id=3, product_id=product_ids[1], quantity=1))
+        db.session.commit()
+
+        store.flush()
+    assert _row(app, 3, product_ids[1]).quantity == 1
+
+
+def test_checkout_flushes_pending_quantities(app, client, store, product_ids):
+    product_id = product_ids[0]
+    client.post('/api/cart/add', json={'product_id': product_id}, headers=HEADERS)
+    client.post('/api/cart/update', json={'product_id': product_id, 'quantity': 3}, headers=HEADERS)
+
+    response = client.post('/api/orders/checkout', json={
+        'cart_item_ids': [_row(app, 2, product_id).id], 'address_id': 1,
+    }, headers=HEADERS)
+    assert response.status_code == 200
+    order_id = response.get_json()['data']['order_id']
+    with app.app_context():
+        assert db.session.execute(
+            db.select(OrderItem.quantity).where(OrderItem.order_id == order_id)
+        ).scalar_one() == 3
+        assert db.session.get(Product, product_id).stock == 97
+    assert _row(app, 2, product_id) is None
@@ -0,0 +1,21 @@
+from app import create_app, db
+from app.models.product import Category
+from app.utils import meta
+
+
+def test_restart_does_not_change_category_etag(app, client):
+    """分类回填只在首次启动时执行，重启后 catalog_version 和分类列表的 ETag 不变"""
+    with app.app_context():
+        version = meta.get_value(meta.CATALOG_VERSION)
+        assert meta.get_value(meta.CATEGORIES_BACKFILLED) == 1
+        assert db.session.query(db.func.sum(Category.product_count)).scalar() == 5
+    etag = client.get('/api/products/categories').headers['ETag']
+
+    restarted = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI']})
+    with restarted.app_context():
+        assert meta.get_value(meta.CATALOG_VERSION) == version
+    response = restarted.test_client().get('/api/products/categories', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    with restarted.app_context():
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,122 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models.order import Order, OrderArchive, OrderItem
+from app.models.product import Product
+from app.utils.archive import archive_orders
+
+# 并发下单吞吐量下限（单/秒）
+MIN_ORDERS_PER_SECOND = 20
+
+HEADERS = {'Authorization': 'Bearer 2:0'}
+
+
+def test_concurrent_orders_do_not_oversell(app):
+    """20 个线程同时抢购库存为 10 的商品，成功下单的数量等于库存，库存不会变为负数"""
+    with app.app_context():
+        product = Product(name='限量商品', price=10, stock=10)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+
+    statuses = []
+    barrier = threading.Barrier(20)
+
+    def buy():
+        client = app.test_client()
+        barrier.wait()
+        response = client.post(
+            '/api/orders/create',
+            json={'address_id': 1, 'items': [{'product_id': product_id, 'quantity': 1}]},
+            headers=HEADERS,
+        )
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=buy) for _ in range(20)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    # 成功和因库存不足被拒绝的请求都计入吞吐量；下限很宽松，只用于发现锁等待、重试等造成的严重退化
+    throughput = len(statuses) / elapsed
+    print(f'20 个线程下单: {elapsed * 1000:.0f} 毫秒，{throughput:.0f} 单/秒')
+    assert throughput >= MIN_ORDERS_PER_SECOND
+
+    assert statuses.count(200) == 10
+    assert statuses.count(400) == 10
+    with app.app_context():
+        assert db.session.get(Product, product_id).stock == 0
+        sold = db.session.query(db.func.sum(OrderItem.quantity)).filter_by(product_id=product_id).scalar()
+        assert sold == 10
+
+
+@pytest.fixture
+def interleaved_orders(app, client):
+    """用户 2 的订单：较早的一半已归档，另有一个未完结的订单比所有归档订单都早（仍在 orders 中）
+
+    返回按 created_at DESC, id DESC 排列的订单 id。
+    """
+    with app.app_context():
+        product_id = db.session.query(Product.id).order_by(Product.id).first()[0]
+    order_ids = []
+    for _ in range(12):
+        response = client.post('/api/orders', json={
+            'user_id': 2, 'address_id': 1, 'items': [{'product_id': product_id, 'quantity': 1}],
+        })
+        order_ids.append(response.get_json()['order_id'])
+    now = datetime.utcnow()
+    with app.app_context():
+        for index, order_id in enumerate(order_ids):
+            order = db.session.get(Order, order_id)
+            order.created_at = now - timedelta(days=index * 40)
+            if index >= 6:
+                order.status = 'delivered'
+        db.session.get(Order, order_ids[0]).created_at = now - timedelta(days=1000)
+        db.session.commit()
+        assert archive_orders(days=200) == 6
+        live = db.session.query(Order.id, Order.created_at).filter_by(user_id=2)
+        archived = db.session.query(OrderArchive.id, OrderArchive.created_at).filter_by(user_id=2)
+        rows = live.all() + archived.all()
+    rows.sort(key=lambda row: (row.created_at is not None, row.created_at or datetime.min, row.id), reverse=True)
+    return [row.id for row in rows]
+
+
+def _collect_offset(client, url, key, size, total):
+    """逐页读取直到空页，检查每页的 has_more / total"""
+    ids, page = [], 1
+    while True:
+        data = client.get(f'{url}page={page}&{size}', headers=HEADERS).get_json()
+        items = key(data)
+        ids += [item.get('order_id', item.get('id')) for item in items]
+        if 'has_more' in data:
+            assert data['has_more'] == (len(ids) < total)
+        if 'total' in data:
+            assert data['total'] == total
+        if not items:
+            return ids
+        page += 1
+
+
+def _collect_cursor(client, url, key, size, next_cursor):
+    ids, cursor = [], ''
+    while cursor is not None:
+        data = client.get(f'{url}cursor={cursor}&{size}', headers=HEADERS).get_json()
+        ids += [item.get('order_id', item.get('id')) for item in key(data)]
+        cursor = next_cursor(data)
+    return ids
+
+
+@pytest.mark.parametrize('url, size, key, next_cursor', [
+    ('/api/orders/list?', 'size=4', lambda data: data['data']['list'], lambda data: data['data']['next_cursor']),
+    ('/api/orders?username=user1&', 'per_page=4', lambda data: data['items'], lambda data: data['next_cursor']),
+    ('/api/orders?username=user1&with_total=1&', 'per_page=4', lambda data: data['items'], lambda data: data['next_cursor']),
+])
+def test_offset_pages_merge_archived_orders_by_time(client, interleaved_orders, url, size, key, next_cursor):
+    """普通分页与游标分页顺序相同：orders 与归档表按 created_at、id 合并，而不是先列完 orders"""
+    expected = interleaved_orders
+    assert _collect_offset(client, url, key, size, len(expected)) == expected
+    assert _collect_cursor(client, url, key, size, next_cursor) == expected
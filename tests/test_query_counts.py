@@ -0,0 +1,116 @@
+"""查询次数回归测试：列表接口的查询次数不随返回的条数增长（没有 N+1 查询）"""
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models.order import Order
+from app.models.product import Product, ProductImage
+from app.utils import search
+from app.utils.archive import archive_orders
+from app.utils.tags import set_product_tags
+
+
+@pytest.fixture
+def many_products(app):
+    with app.app_context():
+        for i in range(60):
+            product = Product(name=f'竹制收纳盒{i}', price=10 + i, stock=5, category='收纳')
+            db.session.add(product)
+            db.session.flush()
+            db.session.add(ProductImage(product_id=product.id, url=f'/static/{i}a.jpg', is_primary=True))
+            db.session.add(ProductImage(product_id=product.id, url=f'/static/{i}b.jpg'))
+            set_product_tags(product, '可回收,低碳')
+            search.index_product(product)
+        db.session.commit()
+
+
+def _queries(client, count_queries, url):
+    with count_queries() as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('url', [
+    '/api/products?per_page={size}',
+    '/api/products/list?size={size}',
+    '/api/products/list?size={size}&cursor=',
+    '/api/products/list?size={size}&keyword=竹制',
+    '/api/products/list?size={size}&eco_labels=可回收&in_stock=1',
+])
+def test_product_lists_are_n_plus_one_free(client, count_queries, many_products, url):
+    small = _queries(client, count_queries, url.format(size=5))
+    large = _queries(client, count_queries, url.format(size=50))
+    assert large == small
+    assert large <= 6
+
+
+def _place_order(client, product_ids):
+    response = client.post('/api/orders', json={
+        'user_id': 2, 'address_id': 1,
+        'items': [{'product_id': product_id, 'quantity': 1} for product_id in product_ids],
+    })
+    assert response.status_code == 201
+    return response.get_json()['order_id']
+
+
+@pytest.fixture
+def many_orders(app, client, many_products):
+    """用户 2 的 40 个订单，其中较早的 20 个已归档"""
+    with app.app_context():
+        product_ids = [product_id for product_id, in db.session.query(Product.id).order_by(Product.id)]
+    order_ids = [_place_order(client, product_ids[i:i + 3]) for i in range(40)]
+    with app.app_context():
+        Order.query.filter(Order.id.in_(order_ids[:20])).update(
+            {'status': 'delivered', 'created_at': datetime.utcnow() - timedelta(days=400)},
+            synchronize_session=False
+        )
+        db.session.commit()
+        assert archive_orders() == 20
+    return product_ids
+
+
+@pytest.mark.parametrize('url, small_size, large_size', [
+    # 只有 orders 中的订单
+    ('/api/orders/list?size={size}', 5, 15),
+    ('/api/orders/list?size={size}&cursor=', 5, 15),
+    # 本页跨过 orders 的末尾，需要合并归档订单
+    ('/api/orders/list?size={size}', 25, 35),
+    ('/api/orders/list?size={size}&cursor=', 25, 35),
+    ('/api/orders/list?size={size}&page=2', 12, 18),
+])
+def test_order_list_is_n_plus_one_free(client, count_queries, many_orders, url, small_size, large_size):
+    headers = {'Authorization': 'Bearer 2:0'}
+    with count_queries() as small:
+        assert client.get(url.format(size=small_size), headers=headers).status_code == 200
+    with count_queries() as large:
+        assert client.get(url.format(size=large_size), headers=headers).status_code == 200
+    assert len(large) == len(small)
+    assert len(large) <= 8
+
+
+def test_order_detail_query_count_does_not_grow_with_items(client, count_queries, many_orders):
+    headers = {'Authorization': 'Bearer 2:0'}
+    one_item = _place_order(client, many_orders[:1])
+    many_items = _place_order(client, many_orders[:12])
+    with count_queries() as small:
+        assert client.get(f'/api/orders/detail?order_id={one_item}', headers=headers).status_code == 200
+    with count_queries() as large:
+        assert client.get(f'/api/orders/detail?order_id={many_items}', headers=headers).status_code == 200
+    assert len(large) == len(small)
+    assert len(large) <= 3
+
+
+def test_cart_list_is_n_plus_one_free(client, count_queries, many_products, app):
+    with app.app_context():
+        product_ids = [product_id for product_id, in db.session.query(Product.id).order_by(Product.id)]
+    for user_id, count in ((2, 2), (3, 20)):
+        for product_id in product_ids[:count]:
+            response = client.post('/api/cart/add', json={'product_id': product_id},
+                                   headers={'Authorization': f'Bearer {user_id}:0'})
+            assert response.status_code == 200
+    with count_queries() as small:
+        assert client.get('/api/cart/list', headers={'Authorization': 'Bearer 2:0'}).status_code == 200
+    with count_queries() as large:
+        assert client.get('/api/cart/list', headers={'Authorization': 'Bearer 3:0'}).status_code == 200
+    assert len(large) == len(small)
+    assert len(large) <= 2